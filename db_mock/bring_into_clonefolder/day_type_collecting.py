@@ -10,11 +10,24 @@ Adapted for: Spark + Airflow environment
 Purpose: Update day_type column for newly added MOT data (where day_type = -1)
 """
 
-import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import io
 import os
+import json
 import time
+import tempfile
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, date, timedelta
 import calendar
 import sys
@@ -29,24 +42,51 @@ DB_CONFIG = {
     "password": "airflow"
 }
 
+logger = logging.getLogger(__name__)
+
+# ชื่อประเภทวัน เรียงตามรหัส day_type (0, 1, 2)
+DAY_CATEGORIES = ["Holiday", "Normal/Weekend", "Festival"]
+
+# ชื่อวันในสัปดาห์ เรียงตาม date.weekday() (Monday=0)
+_WD = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Connection pool - สร้างครั้งแรกที่ใช้งาน แล้วใช้ซ้ำตลอดอายุ process
+_POOL: Optional[ThreadedConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool() -> ThreadedConnectionPool:
+    """คืน connection pool ของ module (สร้างใหม่ถ้ายังไม่มี)"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadedConnectionPool(minconn=1, maxconn=4, **DB_CONFIG)
+            atexit.register(_POOL.closeall)
+    return _POOL
+
+@contextmanager
+def _conn():
+    """ยืม connection จาก pool และคืนกลับเมื่อใช้งานเสร็จ"""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 def get_day_type_null_dates_from_db() -> List[date]:
     """ดึงวันที่ที่มี day_type เป็น -1 จากฐานข้อมูล"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT feature_date 
-            FROM features 
-            WHERE day_type = -1 
-            ORDER BY feature_date
-        """)
-        
-        results = cur.fetchall()
-        null_dates = [row[0] for row in results]
-        
-        cur.close()
-        conn.close()
+        # server-side cursor: ดึงผลลัพธ์ทีละ batch แทนการโหลดทั้งหมดด้วย fetchall
+        with _conn() as conn, conn.cursor(name='null_day_type_dates_cur') as cur:
+            cur.itersize = 10000
+            cur.execute("""
+                SELECT feature_date 
+                FROM features 
+                WHERE day_type = -1 
+                ORDER BY feature_date
+            """)
+            
+            null_dates = [row[0] for row in cur]
         
         print(f"📅 พบวันที่ที่ยังไม่มีข้อมูล day_type: {len(null_dates)} วัน")
         if null_dates:
@@ -58,51 +98,128 @@ def get_day_type_null_dates_from_db() -> List[date]:
         print(f"❌ Error getting day_type null dates: {e}")
         return []
 
-def download_holiday_calendar() -> Optional[pd.DataFrame]:
-    """ดาวน์โหลดปฏิทินวันหยุดจาก myhora.com"""
+# HTTP session ใช้ซ้ำ (keep-alive) สำหรับดาวน์โหลดปฏิทินวันหยุด
+# retry อัตโนมัติเมื่อ server ตอบ 5xx (exponential backoff)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(max_retries=Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[500, 502, 503, 504],
+    allowed_methods=["GET"]
+)))
+
+# จำนวนครั้งที่ลองใหม่เมื่อการเชื่อมต่อหลุดระหว่างดาวน์โหลด
+DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def _read_cache_meta(meta_path: str) -> Dict[str, str]:
+    """อ่าน ETag / Last-Modified ของไฟล์ปฏิทินที่ cache ไว้"""
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _fetch_holiday_csv(download_url: str, csv_path: str, meta_path: str, headers: Dict[str, str]) -> Optional[pd.DataFrame]:
+    """ดาวน์โหลดไฟล์ปฏิทินแบบ stream และอ่านเป็น DataFrame คืนค่า None ถ้า server ตอบ 304 (ใช้ไฟล์เดิม)"""
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        try:
+            with _SESSION.get(download_url, headers=headers, timeout=(5, 30), stream=True) as response:
+                if response.status_code == 304:
+                    return None
+                response.raise_for_status()
+                
+                # เขียนลงไฟล์ชั่วคราวก่อน เพื่อไม่ให้ไฟล์ cache เสียถ้าดาวน์โหลดไม่ครบ
+                # แล้วอ่านด้วย pandas จาก handle เดิม (ไม่ต้องเปิดไฟล์ซ้ำ)
+                tmp = tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(csv_path), suffix='.part', delete=False
+                )
+                try:
+                    with tmp:
+                        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            tmp.write(chunk)
+                        tmp.seek(0)
+                        holiday_df = pd.read_csv(tmp, encoding='utf-8-sig')
+                    os.replace(tmp.name, csv_path)
+                except BaseException:
+                    os.unlink(tmp.name)
+                    raise
+                
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')
+                    }, f)
+                return holiday_df
+        
+        except requests.ConnectionError as e:
+            if attempt == DOWNLOAD_ATTEMPTS:
+                raise
+            print(f"⚠️ การเชื่อมต่อล้มเหลว (ครั้งที่ {attempt}/{DOWNLOAD_ATTEMPTS}): {e}")
+            time.sleep(2 ** attempt)
+
+@lru_cache(maxsize=4)
+def _load_holiday_df(current_year: int) -> pd.DataFrame:
+    """ดาวน์โหลดและอ่านปฏิทินวันหยุดของปี (พ.ศ.) - cache ไว้ใน process
     
-    current_year = datetime.now().year + 543  # Buddhist year
+    ถ้าล้มเหลวจะ raise exception ออกไป (lru_cache จะไม่ cache ผลที่ล้มเหลว)
+    DataFrame ที่คืนค่าถูกใช้ร่วมกันระหว่างการเรียก ห้ามแก้ไข in-place
+    """
     download_url = f"https://www.myhora.com/calendar/ical/holiday.aspx?{current_year}.csv"
     
     # สร้างโฟลเดอร์ชั่วคราวใน container
     folder = "/tmp/holiday_data"
     csv_filename = f'myhora-holiday-calendar-{current_year}.csv'
     
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+    os.makedirs(folder, exist_ok=True)
     
     csv_path = os.path.join(folder, csv_filename)
+    meta_path = csv_path + '.meta'
+    
+    # ถ้ามีไฟล์เดิมอยู่แล้ว ส่ง conditional GET เพื่อข้ามการดาวน์โหลดซ้ำ
+    headers = {}
+    if os.path.exists(csv_path):
+        meta = _read_cache_meta(meta_path)
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
     
     print(f"📥 กำลังดาวน์โหลดปฏิทินวันหยุด ปี {current_year}")
     
-    try:
-        response = requests.get(download_url, timeout=30)
-        response.raise_for_status()
-        
-        with open(csv_path, 'wb') as f:
-            f.write(response.content)
-        
+    holiday_df = _fetch_holiday_csv(download_url, csv_path, meta_path, headers)
+    if holiday_df is not None:
         print(f"✅ ดาวน์โหลดสำเร็จ: {csv_path}")
-        
-        # อ่านไฟล์
+    else:
+        print(f"✅ ปฏิทินไม่มีการเปลี่ยนแปลง ใช้ไฟล์เดิม: {csv_path}")
         holiday_df = pd.read_csv(csv_path, encoding='utf-8-sig')
-        print(f"📊 โหลดข้อมูลวันหยุด: {len(holiday_df)} รายการ")
-        
-        if len(holiday_df) > 0:
-            print(f"📋 คอลัมน์: {holiday_df.columns.tolist()}")
-            print("📋 ตัวอย่างข้อมูล:")
-            for _, row in holiday_df.head(3).iterrows():
-                start_date = row.get('Start Date', 'N/A')
-                summary = row.get('Summary', 'N/A')
-                print(f"   {start_date}: {summary}")
-        
-        return holiday_df
+    
+    print(f"📊 โหลดข้อมูลวันหยุด: {len(holiday_df)} รายการ")
+    
+    if len(holiday_df) > 0:
+        print(f"📋 คอลัมน์: {holiday_df.columns.tolist()}")
+        print("📋 ตัวอย่างข้อมูล:")
+        for _, row in holiday_df.head(3).iterrows():
+            start_date = row.get('Start Date', 'N/A')
+            summary = row.get('Summary', 'N/A')
+            print(f"   {start_date}: {summary}")
+    
+    return holiday_df
+
+def download_holiday_calendar() -> Optional[pd.DataFrame]:
+    """ดาวน์โหลดปฏิทินวันหยุดจาก myhora.com"""
+    
+    current_year = datetime.now().year + 543  # Buddhist year
+    
+    try:
+        return _load_holiday_df(current_year)
         
     except Exception as e:
         print(f"❌ ไม่สามารถดาวน์โหลดปฏิทินวันหยุด: {e}")
         print("⚠️ จะใช้ข้อมูลเทศกาลเท่านั้น")
         return pd.DataFrame(columns=['Start Date', 'Summary'])
 
+@lru_cache(maxsize=64)
 def get_second_saturday(year: int, month: int) -> str:
     """หาเสาร์ที่ 2 ของเดือน (วันเด็ก)"""
     cal = calendar.monthcalendar(year, month)
@@ -120,12 +237,11 @@ def get_second_saturday(year: int, month: int) -> str:
     
     return f"{year:04d}-{month:02d}-{second_saturday:02d}"
 
-def get_festival_dates(year: int) -> Dict[str, str]:
-    """กำหนดวันเทศกาลต่างๆ"""
-    
+def _festival_table(year: int) -> Dict[str, str]:
+    """ตารางวันเทศกาลของปี {ชื่อเทศกาล: 'YYYY-MM-DD'}"""
     second_sat_jan = get_second_saturday(year, 1)
     
-    festivals = {
+    return {
         "วันเด็ก": second_sat_jan,
         "วาเลนไทน์": f"{year}-02-14",
         "สงกรานต์ วันที่ 1": f"{year}-04-13",
@@ -135,12 +251,34 @@ def get_festival_dates(year: int) -> Dict[str, str]:
         "คริสต์มาส": f"{year}-12-25",
         "วันสิ้นปี": f"{year}-12-31",
     }
-    
-    print("🎉 เทศกาลที่กำหนด:")
-    for name, date in festivals.items():
-        print(f"   {name}: {date}")
-    
-    return festivals
+
+def _log_festivals(years) -> None:
+    """log รายการวันเทศกาลของแต่ละปีที่ระดับ DEBUG (ไม่รกใน log ของ Airflow ตามค่าปกติ)"""
+    for year in sorted(years):
+        logger.debug("🎉 เทศกาลที่กำหนด ปี %d:\n%s", year, "\n".join(
+            f"   {name}: {festival_date}" for name, festival_date in _festival_table(year).items()
+        ))
+
+@lru_cache(maxsize=64)
+def _festival_dates_pure(year: int) -> frozenset:
+    """วันเทศกาลของปี (เฉพาะวันที่) แบบ cache และไม่มีการ print"""
+    return frozenset(_festival_table(year).values())
+
+def parse_holiday_dates(holiday_df: pd.DataFrame) -> frozenset:
+    """แปลงคอลัมน์ 'Start Date' ของปฏิทินวันหยุดเป็น frozenset ของ 'YYYY-MM-DD'"""
+    if len(holiday_df) == 0 or 'Start Date' not in holiday_df.columns:
+        return frozenset()
+    
+    # รองรับทั้งรูปแบบ 20250101 และ 2025-01-01 (parse ทั้งคอลัมน์ในครั้งเดียว)
+    raw = holiday_df['Start Date'].astype(str).str.strip()
+    parsed = pd.to_datetime(raw, format='%Y%m%d', errors='coerce').fillna(
+        pd.to_datetime(raw, format='%Y-%m-%d', errors='coerce')
+    )
+    return frozenset(parsed.dropna().dt.strftime('%Y-%m-%d').tolist())
+
+def collect_festival_dates(years) -> frozenset:
+    """รวบรวมวันเทศกาลของทุกปีที่ระบุ"""
+    return frozenset(d for y in sorted(years) for d in _festival_dates_pure(y))
 
 def classify_day_types(dates: List[date], holiday_df: pd.DataFrame) -> pd.DataFrame:
     """จำแนกประเภทวันสำหรับวันที่ที่ระบุ"""
@@ -151,115 +289,95 @@ def classify_day_types(dates: List[date], holiday_df: pd.DataFrame) -> pd.DataFr
     # แยกปีออกมาจากวันที่
     years = set(d.year for d in dates)
     
-    print(f"🗓️ กำลังจำแนกประเภทวันสำหรับ {len(dates)} วัน")
-    print(f"📅 ปีที่ครอบคลุม: {sorted(years)}")
+    logger.info("🗓️ กำลังจำแนกประเภทวันสำหรับ %d วัน", len(dates))
+    logger.info("📅 ปีที่ครอบคลุม: %s", sorted(years))
     
     # สร้าง set ของวันหยุด
-    holiday_dates = set()
-    if len(holiday_df) > 0 and 'Start Date' in holiday_df.columns:
-        for _, row in holiday_df.iterrows():
-            try:
-                date_str = str(row['Start Date']).strip()
-                if len(date_str) == 8:  # Format: 20250101
-                    date_obj = datetime.strptime(date_str, '%Y%m%d')
-                    holiday_dates.add(date_obj.strftime('%Y-%m-%d'))
-                elif '-' in date_str:  # Format: 2025-01-01
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                    holiday_dates.add(date_obj.strftime('%Y-%m-%d'))
-            except Exception:
-                continue
-    
-    print(f"🏖️ โหลดวันหยุดราชการ: {len(holiday_dates)} วัน")
+    holiday_dates = parse_holiday_dates(holiday_df)
+    logger.info("🏖️ โหลดวันหยุดราชการ: %d วัน", len(holiday_dates))
     
     # รวบรวมวันเทศกาลจากทุกปี
-    festival_dates = set()
-    for year in years:
-        year_festivals = get_festival_dates(year)
-        festival_dates.update(year_festivals.values())
-    
-    print(f"🎉 วันเทศกาลทั้งหมด: {len(festival_dates)} วัน")
-    
-    # จำแนกประเภทแต่ละวัน
-    day_type_data = []
-    
-    for date_obj in dates:
-        date_str = date_obj.strftime('%Y-%m-%d')
-        
-        # ลำดับความสำคัญ: วันหยุด (0) > เทศกาล (2) > วันปกติ (1)
-        if date_str in holiday_dates:
-            day_type = 0
-            day_category = "Holiday"
-        elif date_str in festival_dates:
-            day_type = 2
-            day_category = "Festival"
-        else:
-            day_type = 1
-            day_category = "Normal/Weekend"
-        
-        # ข้อมูลเสริม
-        weekday = date_obj.strftime('%A')
-        is_weekend = date_obj.weekday() >= 5  # Saturday=5, Sunday=6
-        
-        day_type_data.append({
-            'feature_date': date_obj,
-            'day_type': day_type,
-            'day_category': day_category,
-            'weekday': weekday,
-            'is_weekend': is_weekend
-        })
-    
-    result_df = pd.DataFrame(day_type_data)
+    festival_dates = collect_festival_dates(years)
+    logger.info("🎉 วันเทศกาลทั้งหมด: %d วัน", len(festival_dates))
+    
+    # จำแนกประเภทแต่ละวันแบบ vectorized
+    # ลำดับความสำคัญ: วันหยุด (0) > เทศกาล (2) > วันปกติ (1)
+    s = pd.to_datetime(pd.Series(dates))
+    iso = np.datetime_as_string(s.to_numpy(dtype='datetime64[D]'), unit='D')
+    wd = s.dt.weekday.to_numpy()
+    
+    holiday_arr = np.fromiter(holiday_dates, dtype='U10', count=len(holiday_dates))
+    festival_arr = np.fromiter(festival_dates, dtype='U10', count=len(festival_dates))
+    is_hol = np.isin(iso, holiday_arr)
+    is_fest = np.isin(iso, festival_arr)
+    day_type = np.where(is_hol, 0, np.where(is_fest, 2, 1)).astype(np.int8)
+    
+    result_df = pd.DataFrame({
+        'feature_date': dates,
+        'day_type': day_type,
+        'day_category': pd.Categorical.from_codes(day_type, categories=DAY_CATEGORIES),
+        'weekday': np.asarray(_WD)[wd],
+        'is_weekend': wd >= 5  # Saturday=5, Sunday=6
+    }, copy=False)
     
     # สรุปผลการจำแนก
-    print(f"\n📊 สรุปการจำแนกประเภทวัน:")
+    logger.info("📊 สรุปการจำแนกประเภทวัน:")
     if not result_df.empty:
         type_counts = result_df['day_category'].value_counts()
-        for category, count in type_counts.items():
-            day_type_num = result_df[result_df['day_category'] == category]['day_type'].iloc[0]
-            print(f"   {category} (type {day_type_num}): {count} วัน")
+        for category, count in type_counts[type_counts > 0].items():
+            logger.info("   %s (type %d): %d วัน", category, DAY_CATEGORIES.index(category), count)
         
-        # แสดงตัวอย่าง
-        print(f"\n📋 ตัวอย่างการจำแนก:")
-        for day_type in [0, 1, 2]:
-            examples = result_df[result_df['day_type'] == day_type].head(2)
-            if len(examples) > 0:
-                category = examples.iloc[0]['day_category']
-                print(f"   {category} (type {day_type}):")
-                for _, row in examples.iterrows():
-                    print(f"     {row['feature_date']} ({row['weekday']})")
+        # แสดงตัวอย่าง (เฉพาะ DEBUG)
+        if logger.isEnabledFor(logging.DEBUG):
+            examples = result_df.groupby('day_type', observed=True).head(2)
+            logger.debug("📋 ตัวอย่างการจำแนก:\n%s", examples[['feature_date', 'day_type', 'day_category', 'weekday']].to_string(index=False))
     
     return result_df
 
 def update_day_type_in_db(day_type_data: pd.DataFrame) -> bool:
-    """อัพเดต day_type ในฐานข้อมูล"""
+    """อัพเดต day_type ในฐานข้อมูล
+    
+    ใช้ SET LOCAL synchronous_commit = off ภายใน transaction เดียว เพื่อไม่ต้องรอ flush WAL ตอน commit
+    ข้อแลกเปลี่ยน: ถ้า PostgreSQL crash ทันทีหลัง commit อาจเสียการอัพเดตล่าสุด
+    (ไม่กระทบความถูกต้องของข้อมูล - แถวจะยังเป็น day_type = -1 และถูกจำแนกใหม่ในรอบถัดไป)
+    """
     if day_type_data is None or day_type_data.empty:
         print("❌ ไม่มีข้อมูล day_type ให้อัพเดต")
         return False
     
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+        with _conn() as conn, conn.cursor() as cur:
+            print(f"🔄 กำลังอัพเดต day_type สำหรับ {len(day_type_data)} วัน...")
+            
+            conn.autocommit = False
+            cur.execute("SET LOCAL synchronous_commit = off")
         
-        print(f"🔄 กำลังอัพเดต day_type สำหรับ {len(day_type_data)} วัน...")
+            # อัพเดตทั้งหมดใน statement เดียว (execute_values รวมเป็น VALUES list)
+            rows = list(zip(
+                day_type_data['feature_date'].tolist(),
+                day_type_data['day_type'].astype(int).tolist()
+            ))
         
-        # อัพเดตทีละรายการ
-        updated_count = 0
-        for _, row in day_type_data.iterrows():
-            feature_date = row['feature_date']
-            day_type = int(row['day_type'])
-            
+            # ล็อกแถวตามลำดับ feature_date ก่อน UPDATE (rain_collecting ทำงานพร้อมกันและล็อกลำดับเดียวกัน
+            # จึงไม่เกิด deadlock)
             cur.execute("""
+                SELECT feature_date FROM features 
+                WHERE feature_date = ANY(%s::date[]) AND day_type = -1 
+                ORDER BY feature_date 
+                FOR UPDATE
+            """, ([fd for fd, _ in rows],))
+        
+            # ใช้ RETURNING นับแถวที่อัพเดต (cur.rowcount จะนับแค่ page สุดท้าย)
+            updated = execute_values(cur, """
                 UPDATE features 
-                SET day_type = %s 
-                WHERE feature_date = %s AND day_type = -1
-            """, (day_type, feature_date))
-            
-            if cur.rowcount > 0:
-                updated_count += 1
+                SET day_type = data.dt 
+                FROM (VALUES %s) AS data(fd, dt) 
+                WHERE features.feature_date = data.fd AND features.day_type = -1
+                RETURNING features.feature_date
+            """, rows, template="(%s::date, %s::int)", page_size=1000, fetch=True)
+            updated_count = len(updated)
         
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
         
         print(f"✅ อัพเดต day_type สำเร็จ: {updated_count}/{len(day_type_data)} รายการ")
         return True
@@ -268,64 +386,145 @@ def update_day_type_in_db(day_type_data: pd.DataFrame) -> bool:
         print(f"❌ ข้อผิดพลาดในการอัพเดต day_type: {e}")
         return False
 
+def apply_day_types_in_db(holiday_dates: frozenset, festival_dates: frozenset) -> Optional[pd.DataFrame]:
+    """จำแนกและอัพเดต day_type ฝั่ง PostgreSQL
+    
+    โหลดวันหยุด/เทศกาลเข้า temp table ด้วย COPY แล้วอัพเดตด้วย UPDATE เดียว
+    ใช้ลำดับความสำคัญเดียวกับ classify_day_types: วันหยุด (0) > เทศกาล (2) > วันปกติ (1)
+    commit แบบ synchronous_commit = off เช่นเดียวกับ update_day_type_in_db
+    คืนค่าแถวที่อัพเดต (feature_date, day_type, day_category) หรือ None ถ้าล้มเหลว
+    """
+    try:
+        with _conn() as conn, conn.cursor() as cur:
+            logger.info("🔄 กำลังจำแนกและอัพเดต day_type ในฐานข้อมูล...")
+            
+            conn.autocommit = False
+            cur.execute("SET LOCAL synchronous_commit = off")
+            
+            cur.execute("""
+                CREATE TEMP TABLE special_dates (
+                    d DATE PRIMARY KEY, 
+                    dt SMALLINT NOT NULL
+                ) ON COMMIT DROP
+            """)
+            
+            # วันหยุดมีความสำคัญกว่าเทศกาล - ตัดวันเทศกาลที่ซ้ำกับวันหยุดออก
+            buf = io.StringIO()
+            buf.writelines(f"{d}\t0\n" for d in sorted(holiday_dates))
+            buf.writelines(f"{d}\t2\n" for d in sorted(festival_dates - holiday_dates))
+            buf.seek(0)
+            cur.copy_expert("COPY special_dates (d, dt) FROM STDIN WITH (FORMAT text)", buf)
+            
+            # ล็อกแถวตามลำดับ feature_date ก่อน UPDATE (rain_collecting ทำงานพร้อมกันและล็อกลำดับเดียวกัน
+            # จึงไม่เกิด deadlock)
+            cur.execute("""
+                SELECT feature_date FROM features 
+                WHERE day_type = -1 
+                ORDER BY feature_date 
+                FOR UPDATE
+            """)
+            
+            cur.execute("""
+                UPDATE features 
+                SET day_type = COALESCE(
+                    (SELECT s.dt FROM special_dates s WHERE s.d = features.feature_date), 
+                    1
+                ) 
+                WHERE day_type = -1 
+                RETURNING feature_date, day_type
+            """)
+            updated = sorted(cur.fetchall())
+            
+            conn.commit()
+        
+        day_type = np.fromiter((row[1] for row in updated), dtype=np.int8, count=len(updated))
+        result_df = pd.DataFrame({
+            'feature_date': [row[0] for row in updated],
+            'day_type': day_type,
+            'day_category': pd.Categorical.from_codes(day_type, categories=DAY_CATEGORIES)
+        }, copy=False)
+        
+        logger.info("✅ อัพเดต day_type สำเร็จ: %d รายการ", len(result_df))
+        return result_df
+        
+    except Exception as e:
+        logger.error("❌ ข้อผิดพลาดในการอัพเดต day_type ฝั่งฐานข้อมูล: %s", e)
+        return None
+
 def main():
     """ฟังก์ชันหลัก - รองรับการเรียกใช้จาก Airflow"""
-    print("📅 เริ่มต้นการอัพเดตข้อมูล Day Type (Airflow Mode)")
+    logger.info("📅 เริ่มต้นการอัพเดตข้อมูล Day Type (Airflow Mode)")
     
     # รับ arguments จาก Airflow (optional)
     if len(sys.argv) >= 4:
         postgres_db = sys.argv[1]  # จะได้รับแต่ไม่ใช้ เพราะใช้ DB_CONFIG แทน
         postgres_user = sys.argv[2]
         postgres_pwd = sys.argv[3]
-        print(f"📊 รับ arguments จาก Airflow: db={postgres_db}, user={postgres_user}")
+        logger.info("📊 รับ arguments จาก Airflow: db=%s, user=%s", postgres_db, postgres_user)
     else:
-        print("📊 รันในโหมด standalone")
+        logger.info("📊 รันในโหมด standalone")
+    
+    # 1-2. ตรวจสอบวันที่ที่ยังไม่มีข้อมูล day_type และดาวน์โหลดปฏิทินวันหยุดพร้อมกัน
+    # (ทั้งสองงานเป็น I/O ที่ไม่ขึ้นต่อกัน จึงรันคู่ขนานได้)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fut_dates = executor.submit(get_day_type_null_dates_from_db)
+        fut_calendar = executor.submit(download_holiday_calendar)
+        null_day_type_dates = fut_dates.result()
+        holiday_df = fut_calendar.result()
     
-    # 1. ตรวจสอบวันที่ที่ยังไม่มีข้อมูล day_type
-    null_day_type_dates = get_day_type_null_dates_from_db()
     if not null_day_type_dates:
-        print("✅ ไม่มีวันที่ที่ต้องอัพเดต day_type")
+        logger.info("✅ ไม่มีวันที่ที่ต้องอัพเดต day_type")
         return True
     
-    print(f"📅 พบ {len(null_day_type_dates)} วันที่ต้องเติมข้อมูล day_type")
-    
-    # 2. ดาวน์โหลดปฏิทินวันหยุด (อย่างน้อย 1 ครั้ง)
-    holiday_df = download_holiday_calendar()
-    
-    # 3. จำแนกประเภทวัน
-    day_type_data = classify_day_types(null_day_type_dates, holiday_df)
-    if day_type_data is None or day_type_data.empty:
-        print("❌ ไม่สามารถจำแนกประเภทวันได้")
-        return False
-    
-    # 4. อัพเดตข้อมูลในฐานข้อมูล
-    success = update_day_type_in_db(day_type_data)
+    logger.info("📅 พบ %d วันที่ต้องเติมข้อมูล day_type", len(null_day_type_dates))
+    
+    # 3-4. จำแนกประเภทวันและอัพเดตในฐานข้อมูล (คำนวณฝั่ง PostgreSQL)
+    years = set(d.year for d in null_day_type_dates)
+    holiday_dates = parse_holiday_dates(holiday_df)
+    festival_dates = collect_festival_dates(years)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log_festivals(years)
+    logger.info("🏖️ วันหยุดราชการ: %d วัน, 🎉 วันเทศกาล: %d วัน", len(holiday_dates), len(festival_dates))
+    
+    day_type_data = apply_day_types_in_db(holiday_dates, festival_dates)
+    success = day_type_data is not None
+    
+    if not success:
+        # สำรอง: จำแนกใน Python แล้วอัพเดตแบบ batch
+        logger.warning("⚠️ จำแนกฝั่งฐานข้อมูลไม่สำเร็จ ใช้การจำแนกใน Python แทน")
+        day_type_data = classify_day_types(null_day_type_dates, holiday_df)
+        if day_type_data is None or day_type_data.empty:
+            logger.error("❌ ไม่สามารถจำแนกประเภทวันได้")
+            return False
+        
+        success = update_day_type_in_db(day_type_data)
     
     if success:
-        print("🎉 การอัพเดตข้อมูล day_type เสร็จสิ้นสำเร็จ!")
+        logger.info("🎉 การอัพเดตข้อมูล day_type เสร็จสิ้นสำเร็จ!")
         
         # แสดงสรุปข้อมูล
-        print(f"\n📊 สรุปข้อมูล day_type ที่อัพเดต:")
-        print(f"   - จำนวนวัน: {len(day_type_data)}")
+        logger.info("📊 สรุปข้อมูล day_type ที่อัพเดต:")
+        logger.info("   - จำนวนวัน: %d", len(day_type_data))
         
         # สถิติตามประเภทวัน
         type_counts = day_type_data['day_category'].value_counts()
-        for category, count in type_counts.items():
-            day_type_num = day_type_data[day_type_data['day_category'] == category]['day_type'].iloc[0]
-            print(f"   - {category} (type {day_type_num}): {count} วัน")
+        for category, count in type_counts[type_counts > 0].items():
+            logger.info("   - %s (type %d): %d วัน", category, DAY_CATEGORIES.index(category), count)
         
         # วันหยุดและเทศกาลที่สำคัญ
         special_days = day_type_data[day_type_data['day_type'].isin([0, 2])]
         if not special_days.empty:
-            print(f"\n🎯 วันพิเศษที่อัพเดต:")
-            for _, row in special_days.head(10).iterrows():
-                print(f"   {row['feature_date']}: {row['day_category']} (type {row['day_type']})")
+            logger.info(
+                "🎯 วันพิเศษที่อัพเดต:\n%s",
+                special_days.head(10)[['feature_date', 'day_category', 'day_type']].to_string(index=False)
+            )
         
         return True
     else:
-        print("❌ การอัพเดตข้อมูล day_type ล้มเหลว")
+        logger.error("❌ การอัพเดตข้อมูล day_type ล้มเหลว")
         return False
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     success = main()
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -281,7 +281,7 @@ def insert_new_data(df: pd.DataFrame) -> bool:
         
         # เตรียมข้อมูลสำหรับ bulk insert
         from psycopg2.extras import execute_values
-        values = [tuple(row) for row in df.values]
+        values = list(df.itertuples(index=False, name=None))
         
         # Execute bulk insert
         execute_values(cur, upsert_sql, values, template=None, page_size=100)
@@ -10,14 +10,21 @@ Adapted for: Spark + Airflow environment
 Purpose: Update rain_average column for newly added MOT data
 """
 
-import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import openmeteo_requests
 import requests_cache
 from retry_requests import retry
 from datetime import datetime, date, timedelta
+import io
 import sys
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import Optional, Dict, List, Any, Tuple
 import numpy as np
 
@@ -30,24 +37,46 @@ DB_CONFIG = {
     "password": "airflow"
 }
 
+# จำนวน thread สำหรับดึงข้อมูลฝนจาก OpenMeteo พร้อมกัน
+FETCH_WORKERS = 16
+
+# Connection pool - สร้างครั้งแรกที่ใช้งาน แล้วใช้ซ้ำตลอดอายุ process
+_POOL: Optional[ThreadedConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool() -> ThreadedConnectionPool:
+    """คืน connection pool ของ module (สร้างใหม่ถ้ายังไม่มี)"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadedConnectionPool(minconn=1, maxconn=8, **DB_CONFIG)
+            atexit.register(_POOL.closeall)
+    return _POOL
+
+@contextmanager
+def _conn():
+    """ยืม connection จาก pool และคืนกลับเมื่อใช้งานเสร็จ"""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 def get_null_rain_dates_from_db() -> List[date]:
     """ดึงวันที่ที่มี rain_average เป็น NULL จากฐานข้อมูล"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT feature_date 
-            FROM features 
-            WHERE rain_average IS NULL 
-            ORDER BY feature_date
-        """)
-        
-        results = cur.fetchall()
-        null_dates = [row[0] for row in results]
-        
-        cur.close()
-        conn.close()
+        # server-side cursor: ดึงผลลัพธ์ทีละ batch แทนการโหลดทั้งหมดด้วย fetchall
+        with _conn() as conn, conn.cursor(name='null_rain_dates_cur') as cur:
+            cur.itersize = 10000
+            cur.execute("""
+                SELECT feature_date 
+                FROM features 
+                WHERE rain_average IS NULL 
+                ORDER BY feature_date
+            """)
+            
+            null_dates = [row[0] for row in cur]
         
         print(f"📅 พบวันที่ที่ยังไม่มีข้อมูลฝน: {len(null_dates)} วัน")
         if null_dates:
@@ -59,92 +88,189 @@ def get_null_rain_dates_from_db() -> List[date]:
         print(f"❌ Error getting null rain dates: {e}")
         return []
 
+@lru_cache(maxsize=1)
 def setup_openmeteo_client():
-    """ตั้งค่า OpenMeteo API client"""
-    cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
+    """ตั้งค่า OpenMeteo API client (สร้างครั้งเดียวแล้วใช้ซ้ำตลอดอายุ process)"""
+    cache_session = requests_cache.CachedSession(
+        '.cache',
+        backend='sqlite',
+        fast_save=True,
+        expire_after=timedelta(hours=6)
+    )
     retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+    
+    # เพิ่มขนาด connection pool ให้พอกับจำนวน thread ที่ดึงข้อมูลพร้อมกัน (คง retry policy เดิมไว้)
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=retry_session.get_adapter("https://").max_retries
+    )
+    retry_session.mount("https://", adapter)
+    retry_session.mount("http://", adapter)
     return openmeteo_requests.Client(session=retry_session)
 
-def get_bangkok_locations():
+# ตำแหน่งสถานีรถไฟฟ้าในกรุงเทพฯ (name, lat, lon) - สร้างครั้งเดียวตอน import
+BANGKOK_LOCATIONS = np.array([
+    # BTS Silom Line
+    ("BTS Siam", 13.7459, 100.5340),
+    ("BTS Chong Nonsi", 13.7236, 100.5310),
+    ("BTS Surasak", 13.7197, 100.5156),
+    ("BTS Saphan Taksin", 13.7197, 100.5089),
+    ("BTS Krung Thon Buri", 13.7211, 100.4944),
+    ("BTS Wongwian Yai", 13.7244, 100.4756),
+    ("BTS Bang Wa", 13.7250, 100.4033),
+    
+    # BTS Sukhumvit Line
+    ("BTS Phrom Phong", 13.7308, 100.5697),
+    ("BTS Thong Lo", 13.7244, 100.5797),
+    ("BTS Ekkamai", 13.7197, 100.5889),
+    ("BTS Phra Khanong", 13.7178, 100.5950),
+    ("BTS On Nut", 13.7056, 100.6014),
+    ("BTS Bang Chak", 13.6936, 100.6078),
+    ("BTS Bearing", 13.6631, 100.6069),
+    ("BTS Samrong", 13.6464, 100.6081),
+    ("BTS Mo Chit", 13.8028, 100.5544),
+    ("BTS Saphan Phut", 13.8139, 100.5556),
+    ("BTS Lat Phrao", 13.8167, 100.6108),
+    
+    # MRT Blue Line
+    ("MRT Hua Lamphong", 13.7375, 100.5169),
+    ("MRT Khlong Toei", 13.7208, 100.5442),
+    ("MRT Queen Sirikit", 13.7286, 100.5561),
+    ("MRT Sukhumvit", 13.7381, 100.5603),
+    ("MRT Phetchaburi", 13.7486, 100.5644),
+    ("MRT Phra Ram 9", 13.7597, 100.5661),
+    ("MRT Sutthisan", 13.7800, 100.5717),
+    ("MRT Huai Khwang", 13.7675, 100.5744),
+    ("MRT Thailand Cultural Centre", 13.7692, 100.5481),
+    ("MRT Chatuchak Park", 13.7981, 100.5522),
+    ("MRT Bang Sue", 13.8200, 100.5344),
+    ("MRT Tao Poon", 13.8064, 100.5206),
+    ("MRT Bang Pho", 13.7892, 100.5139),
+    ("MRT Lat Mayom", 13.7636, 100.4839),
+    
+    # MRT Purple Line
+    ("MRT Khlong Bang Phai", 13.8333, 100.5206),
+    ("MRT Talad Bang Yai", 13.8519, 100.5367),
+    ("MRT Sam Yaek Bang Yai", 13.8656, 100.5447),
+    ("MRT Bang Phlu", 13.8797, 100.5542),
+    ("MRT Bang Rak Yai", 13.8953, 100.5636),
+    ("MRT Tha It", 13.9097, 100.5722),
+    
+    # Airport Rail Link (ARL)
+    ("ARL Phaya Thai", 13.7775, 100.5344),
+    ("ARL Ratchaprarop", 13.7519, 100.5414),
+    ("ARL Makkasan", 13.7450, 100.5631),
+    ("ARL Ramkhamhaeng", 13.7639, 100.6181),
+    ("ARL Hua Mak", 13.7519, 100.6456),
+    ("ARL Ban Thap Chang", 13.7297, 100.6756),
+    ("ARL Lat Krabang", 13.7308, 100.7542),
+    ("ARL Suvarnabhumi", 13.6900, 100.7500),
+    
+    # Major Transport Hubs
+    ("Victory Monument", 13.7650, 100.5375),
+    ("Chatuchak Weekend Market", 13.7981, 100.5522),
+    ("Central World", 13.7467, 100.5400),
+    ("MBK Center", 13.7444, 100.5306),
+    ("Terminal 21", 13.7381, 100.5603),
+    ("EmQuartier", 13.7308, 100.5697),
+    ("ICONSIAM", 13.7267, 100.5089),
+    ("Central Ladprao", 13.8167, 100.6108),
+], dtype=[('name', 'U40'), ('lat', 'f4'), ('lon', 'f4')])
+
+def get_bangkok_locations() -> np.ndarray:
     """ได้รับรายการตำแหน่งสถานีรถไฟฟ้าในกรุงเทพฯ"""
-    return [
-        # BTS Silom Line
-        {"name": "BTS Siam", "lat": 13.7459, "lon": 100.5340},
-        {"name": "BTS Chong Nonsi", "lat": 13.7236, "lon": 100.5310},
-        {"name": "BTS Surasak", "lat": 13.7197, "lon": 100.5156},
-        {"name": "BTS Saphan Taksin", "lat": 13.7197, "lon": 100.5089},
-        {"name": "BTS Krung Thon Buri", "lat": 13.7211, "lon": 100.4944},
-        {"name": "BTS Wongwian Yai", "lat": 13.7244, "lon": 100.4756},
-        {"name": "BTS Bang Wa", "lat": 13.7250, "lon": 100.4033},
-        
-        # BTS Sukhumvit Line
-        {"name": "BTS Phrom Phong", "lat": 13.7308, "lon": 100.5697},
-        {"name": "BTS Thong Lo", "lat": 13.7244, "lon": 100.5797},
-        {"name": "BTS Ekkamai", "lat": 13.7197, "lon": 100.5889},
-        {"name": "BTS Phra Khanong", "lat": 13.7178, "lon": 100.5950},
-        {"name": "BTS On Nut", "lat": 13.7056, "lon": 100.6014},
-        {"name": "BTS Bang Chak", "lat": 13.6936, "lon": 100.6078},
-        {"name": "BTS Bearing", "lat": 13.6631, "lon": 100.6069},
-        {"name": "BTS Samrong", "lat": 13.6464, "lon": 100.6081},
-        {"name": "BTS Mo Chit", "lat": 13.8028, "lon": 100.5544},
-        {"name": "BTS Saphan Phut", "lat": 13.8139, "lon": 100.5556},
-        {"name": "BTS Lat Phrao", "lat": 13.8167, "lon": 100.6108},
-        
-        # MRT Blue Line
-        {"name": "MRT Hua Lamphong", "lat": 13.7375, "lon": 100.5169},
-        {"name": "MRT Khlong Toei", "lat": 13.7208, "lon": 100.5442},
-        {"name": "MRT Queen Sirikit", "lat": 13.7286, "lon": 100.5561},
-        {"name": "MRT Sukhumvit", "lat": 13.7381, "lon": 100.5603},
-        {"name": "MRT Phetchaburi", "lat": 13.7486, "lon": 100.5644},
-        {"name": "MRT Phra Ram 9", "lat": 13.7597, "lon": 100.5661},
-        {"name": "MRT Sutthisan", "lat": 13.7800, "lon": 100.5717},
-        {"name": "MRT Huai Khwang", "lat": 13.7675, "lon": 100.5744},
-        {"name": "MRT Thailand Cultural Centre", "lat": 13.7692, "lon": 100.5481},
-        {"name": "MRT Chatuchak Park", "lat": 13.7981, "lon": 100.5522},
-        {"name": "MRT Bang Sue", "lat": 13.8200, "lon": 100.5344},
-        {"name": "MRT Tao Poon", "lat": 13.8064, "lon": 100.5206},
-        {"name": "MRT Bang Pho", "lat": 13.7892, "lon": 100.5139},
-        {"name": "MRT Lat Mayom", "lat": 13.7636, "lon": 100.4839},
-        
-        # MRT Purple Line
-        {"name": "MRT Khlong Bang Phai", "lat": 13.8333, "lon": 100.5206},
-        {"name": "MRT Talad Bang Yai", "lat": 13.8519, "lon": 100.5367},
-        {"name": "MRT Sam Yaek Bang Yai", "lat": 13.8656, "lon": 100.5447},
-        {"name": "MRT Bang Phlu", "lat": 13.8797, "lon": 100.5542},
-        {"name": "MRT Bang Rak Yai", "lat": 13.8953, "lon": 100.5636},
-        {"name": "MRT Tha It", "lat": 13.9097, "lon": 100.5722},
-        
-        # Airport Rail Link (ARL)
-        {"name": "ARL Phaya Thai", "lat": 13.7775, "lon": 100.5344},
-        {"name": "ARL Ratchaprarop", "lat": 13.7519, "lon": 100.5414},
-        {"name": "ARL Makkasan", "lat": 13.7450, "lon": 100.5631},
-        {"name": "ARL Ramkhamhaeng", "lat": 13.7639, "lon": 100.6181},
-        {"name": "ARL Hua Mak", "lat": 13.7519, "lon": 100.6456},
-        {"name": "ARL Ban Thap Chang", "lat": 13.7297, "lon": 100.6756},
-        {"name": "ARL Lat Krabang", "lat": 13.7308, "lon": 100.7542},
-        {"name": "ARL Suvarnabhumi", "lat": 13.6900, "lon": 100.7500},
-        
-        # Major Transport Hubs
-        {"name": "Victory Monument", "lat": 13.7650, "lon": 100.5375},
-        {"name": "Chatuchak Weekend Market", "lat": 13.7981, "lon": 100.5522},
-        {"name": "Central World", "lat": 13.7467, "lon": 100.5400},
-        {"name": "MBK Center", "lat": 13.7444, "lon": 100.5306},
-        {"name": "Terminal 21", "lat": 13.7381, "lon": 100.5603},
-        {"name": "EmQuartier", "lat": 13.7308, "lon": 100.5697},
-        {"name": "ICONSIAM", "lat": 13.7267, "lon": 100.5089},
-        {"name": "Central Ladprao", "lat": 13.8167, "lon": 100.6108},
-    ]
+    return BANGKOK_LOCATIONS
+
+def _response_to_data(response, location: np.void) -> Dict[str, Any]:
+    """แปลง response ของ OpenMeteo เป็น dict ของวันที่, ปริมาณฝน และข้อมูลสถานี"""
+    # ประมวลผลข้อมูลรายวัน (สร้างแกนวันที่เป็น numpy array โดยตรง ไม่ผ่าน pd.date_range)
+    daily = response.Daily()
+    timestamps = np.arange(daily.Time(), daily.TimeEnd(), daily.Interval(), dtype=np.int64)
+    return {
+        "date": timestamps.astype('datetime64[s]').astype('datetime64[D]'),
+        "location": location["name"],
+        "latitude": location["lat"],
+        "longitude": location["lon"],
+        "rain_sum": daily.Variables(0).ValuesAsNumpy().astype(np.float32, copy=False)
+    }
+
+def _fetch_one(location: np.void, url: str, base_params: Dict[str, Any], openmeteo_client) -> Dict[str, Any]:
+    """ดึงข้อมูลฝนรายวันของสถานีเดียว"""
+    params = dict(base_params, latitude=str(location["lat"]), longitude=str(location["lon"]))
+    
+    responses = openmeteo_client.weather_api(url, params=params)
+    return _response_to_data(responses[0], location)
+
+def _fetch_all(locations: np.ndarray, url: str, base_params: Dict[str, Any], openmeteo_client) -> List[Dict[str, Any]]:
+    """ดึงข้อมูลฝนของทุกสถานีใน request เดียว (OpenMeteo รองรับหลายพิกัดคั่นด้วย comma)"""
+    params = dict(
+        base_params,
+        latitude=",".join(map(str, locations['lat'])),
+        longitude=",".join(map(str, locations['lon'])),
+    )
+    
+    responses = openmeteo_client.weather_api(url, params=params)
+    if len(responses) != len(locations):
+        raise ValueError(f"ได้รับ {len(responses)} responses จาก {len(locations)} จุด")
+    
+    # responses เรียงตามลำดับพิกัดที่ส่งไป
+    return [_response_to_data(response, location) for response, location in zip(responses, locations)]
+
+def _row_nanmean(matrix: np.ndarray) -> np.ndarray:
+    """ค่าเฉลี่ยรายแถวโดยข้าม NaN (แถวที่ไม่มีข้อมูลเลยได้ NaN)"""
+    valid = ~np.isnan(matrix)
+    sums = np.where(valid, matrix, 0).sum(axis=1)
+    counts = valid.sum(axis=1)
+    return np.divide(sums, counts, out=np.full(len(sums), np.nan, dtype=sums.dtype), where=counts > 0)
+
+def _date_runs(dates: List[date]) -> List[Tuple[date, date]]:
+    """แบ่งวันที่เป็นช่วงที่ต่อเนื่องกัน คืนค่า [(วันแรก, วันสุดท้าย), ...]"""
+    days = np.unique(np.array(dates, dtype='datetime64[D]'))
+    breaks = np.where(np.diff(days).astype(int) > 1)[0] + 1
+    return [(run[0].item(), run[-1].item()) for run in np.split(days, breaks)]
+
+def _fetch_range(start_date: date, end_date: date, locations: np.ndarray, url: str, openmeteo_client,
+                 workers: int = FETCH_WORKERS) -> List[Dict[str, Any]]:
+    """ดึงข้อมูลฝนของทุกสถานีในช่วงวันที่ที่ระบุ (workers = จำนวน thread สูงสุดของการดึงทีละจุด)"""
+    base_params = {
+        "daily": "rain_sum",
+        "timezone": "Asia/Bangkok",
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+    }
+    
+    # ดึงข้อมูลทุกจุดในกรุงเทพฯ ด้วย request เดียว
+    try:
+        return _fetch_all(locations, url, base_params, openmeteo_client)
+    except Exception as e:
+        print(f"⚠️ ดึงข้อมูลแบบรวมไม่สำเร็จ ({e}) - ดึงทีละจุดแทน")
+    
+    # สำรอง: ดึงทีละจุดพร้อมกันด้วย thread pool (งานเป็น network I/O ล้วน)
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_fetch_one, location, url, base_params, openmeteo_client): location
+            for location in locations
+        }
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"⚠️ ข้ามจุด {location['name']}: {e}")
+                continue
+    return results
 
 def fetch_rain_data_for_dates(dates: List[date], openmeteo_client) -> Optional[pd.DataFrame]:
     """ดึงข้อมูลฝนสำหรับวันที่ที่ระบุ"""
     if not dates:
         return None
     
-    # กำหนด date range ที่ครอบคลุมวันที่ทั้งหมด
-    start_date = min(dates)
-    end_date = max(dates) + timedelta(days=1)
+    # แบ่งเป็นช่วงวันที่ต่อเนื่อง เพื่อไม่ต้องดึงวันที่ไม่ต้องการระหว่างช่วง
+    runs = _date_runs(dates)
     
-    print(f"🌧️ กำลังดึงข้อมูลฝน: {start_date} ถึง {end_date}")
+    print(f"🌧️ กำลังดึงข้อมูลฝน: {runs[0][0]} ถึง {runs[-1][1]} ({len(runs)} ช่วง)")
     print(f"📊 จำนวนวันที่ต้องการ: {len(dates)} วัน")
     
     bangkok_locations = get_bangkok_locations()
@@ -152,103 +278,103 @@ def fetch_rain_data_for_dates(dates: List[date], openmeteo_client) -> Optional[p
     
     all_data = []
     
-    # ดึงข้อมูลจากหลายจุดในกรุงเทพฯ
-    for i, location in enumerate(bangkok_locations):
-        print(f"🔍 กำลังดึงข้อมูลจากจุดที่ {i+1}/{len(bangkok_locations)}: {location['name']}")
-        
-        params = {
-            "latitude": location["lat"],
-            "longitude": location["lon"],
-            "daily": "rain_sum",
-            "timezone": "Asia/Bangkok",
-            "start_date": start_date.strftime("%Y-%m-%d"),
-            "end_date": end_date.strftime("%Y-%m-%d"),
-        }
-        
-        try:
-            responses = openmeteo_client.weather_api(url, params=params)
-            response = responses[0]
-            
-            # ประมวลผลข้อมูลรายวัน
-            daily = response.Daily()
-            daily_rain_sum = daily.Variables(0).ValuesAsNumpy()
-            
-            daily_data = {
-                "date": pd.date_range(
-                    start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-                    end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-                    freq = pd.Timedelta(seconds = daily.Interval()),
-                    inclusive = "left"
-                ),
-                "location": location["name"],
-                "latitude": location["lat"],
-                "longitude": location["lon"],
-                "rain_sum": daily_rain_sum
-            }
-            
-            location_df = pd.DataFrame(data = daily_data)
-            all_data.append(location_df)
-            
-        except Exception as e:
-            print(f"⚠️ ข้ามจุด {location['name']}: {e}")
-            continue
+    # ดึงทุกช่วงวันที่พร้อมกัน (แต่ละช่วงเป็น request เดียวครอบคลุมทุกจุด)
+    print(f"🔍 กำลังดึงข้อมูลจาก {len(bangkok_locations)} จุด")
+    # แบ่ง thread ของการดึงทีละจุดให้แต่ละช่วง เพื่อให้ request ที่ค้างพร้อมกันรวมไม่เกิน FETCH_WORKERS
+    # (ไม่เกินขนาด connection pool ของ session - connection จะไม่ถูกทิ้งและยังได้ keep-alive)
+    outer_workers = min(len(runs), FETCH_WORKERS)
+    inner_workers = max(1, FETCH_WORKERS // outer_workers)
+    with ThreadPoolExecutor(max_workers=outer_workers) as executor:
+        results = executor.map(
+            lambda run: _fetch_range(
+                run[0], run[1] + timedelta(days=1), bangkok_locations, url, openmeteo_client, inner_workers
+            ),
+            runs
+        )
+        for run_data in results:
+            all_data.extend(run_data)
     
     if not all_data:
         print("❌ ไม่สามารถดึงข้อมูลฝนได้")
         return None
     
-    # รวมข้อมูลทั้งหมด
-    combined_df = pd.concat(all_data, ignore_index=True)
+    # รวมข้อมูลเป็น matrix (จำนวนวัน x จำนวนสถานี) แล้วหาค่าเฉลี่ยรายวันแบบ vectorized
+    station_dates = [d["date"] for d in all_data]
+    date_array = np.unique(np.concatenate(station_dates))
     
-    # คำนวณค่าเฉลี่ยรายวัน
-    daily_average = combined_df.groupby('date')['rain_sum'].agg(['mean']).reset_index()
-    daily_average.columns = ['date', 'rain_average']
+    rain_matrix = np.full((len(date_array), len(all_data)), np.nan, dtype=np.float32)
+    for j, (days, d) in enumerate(zip(station_dates, all_data)):
+        rain_matrix[np.searchsorted(date_array, days), j] = d["rain_sum"]
     
-    # แปลงวันที่เป็น date object
-    daily_average['date'] = daily_average['date'].dt.date
+    rain_average = _row_nanmean(rain_matrix)
     
-    # กรองเฉพาะวันที่ที่ต้องการ
-    daily_average = daily_average[daily_average['date'].isin(dates)]
+    # กรองเฉพาะวันที่ที่ต้องการ (feature_date เป็น primary key จึงไม่ซ้ำกันอยู่แล้ว)
+    # ฝั่งฐานข้อมูลยังกรองซ้ำด้วย rain_average IS NULL ตอน UPDATE
+    mask = np.isin(date_array, np.array(dates, dtype='datetime64[D]'), assume_unique=True)
+    daily_average = pd.DataFrame({
+        'date': date_array[mask].astype(object),  # แปลงเป็น date object
+        'rain_average': rain_average[mask]
+    })
     
     print(f"✅ ดึงข้อมูลฝนเสร็จ: {len(daily_average)} วัน")
     
     # แสดงตัวอย่างข้อมูล
     print("📊 ตัวอย่างข้อมูลฝน (5 วันแรก):")
-    for _, row in daily_average.head().iterrows():
-        print(f"  {row['date']}: {row['rain_average']:.2f} mm")
+    print("\n".join([
+        f"  {d}: {r:.2f} mm"
+        for d, r in zip(daily_average['date'][:5], daily_average['rain_average'][:5])
+    ]))
     
     return daily_average
 
 def update_rain_average_in_db(rain_data: pd.DataFrame) -> bool:
-    """อัพเดต rain_average ในฐานข้อมูล"""
+    """อัพเดต rain_average ในฐานข้อมูล
+    
+    ส่งข้อมูลทั้งหมดด้วย COPY แล้วอัพเดตด้วย UPDATE ... FROM เดียว
+    (ไม่มี round-trip ต่อแถว จึงไม่จำเป็นต้องใช้ pipeline mode ของ psycopg3)
+    """
     if rain_data is None or rain_data.empty:
         print("❌ ไม่มีข้อมูลฝนให้อัพเดต")
         return False
     
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        print(f"🔄 กำลังอัพเดต rain_average สำหรับ {len(rain_data)} วัน...")
-        
-        # อัพเดตทีละรายการ
-        updated_count = 0
-        for _, row in rain_data.iterrows():
-            date_str = row['date']
-            rain_avg = float(row['rain_average'])
+        with _conn() as conn, conn.cursor() as cur:
+            print(f"🔄 กำลังอัพเดต rain_average สำหรับ {len(rain_data)} วัน...")
             
+            # โหลดข้อมูลเข้า temp table ด้วย COPY แล้วอัพเดตด้วย UPDATE ... FROM เดียว
             cur.execute("""
-                UPDATE features 
-                SET rain_average = %s 
-                WHERE feature_date = %s AND rain_average IS NULL
-            """, (rain_avg, date_str))
+                CREATE TEMP TABLE _rain_stage (
+                    feature_date DATE, 
+                    rain_average DOUBLE PRECISION
+                ) ON COMMIT DROP
+            """)
             
-            if cur.rowcount > 0:
-                updated_count += 1
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+            buf = io.StringIO()
+            rain_data[['date', 'rain_average']].to_csv(buf, index=False, header=False)
+            buf.seek(0)
+            cur.copy_expert("COPY _rain_stage (feature_date, rain_average) FROM STDIN WITH CSV", buf)
+            
+            # ล็อกแถวตามลำดับ feature_date ก่อน UPDATE (day_type_collecting ทำงานพร้อมกันและล็อกลำดับเดียวกัน
+            # จึงไม่เกิด deadlock)
+            cur.execute("""
+                SELECT f.feature_date FROM features f 
+                JOIN _rain_stage s ON s.feature_date = f.feature_date 
+                WHERE f.rain_average IS NULL 
+                ORDER BY f.feature_date 
+                FOR UPDATE OF f
+            """)
+            
+            cur.execute("""
+                UPDATE features f 
+                SET rain_average = s.rain_average 
+                FROM _rain_stage s 
+                WHERE f.feature_date = s.feature_date AND f.rain_average IS NULL
+                RETURNING f.feature_date
+            """)
+            updated = cur.fetchall()
+            updated_count = len(updated)
+            
+            conn.commit()
         
         print(f"✅ อัพเดตข้อมูลฝนสำเร็จ: {updated_count}/{len(rain_data)} รายการ")
         return True
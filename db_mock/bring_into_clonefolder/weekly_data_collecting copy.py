@@ -35,20 +35,21 @@ Usage:
 5. View XCom in Airflow UI for quality reports
 """
 
-import os
 import psycopg2
 from airflow import DAG
-from airflow.operators.dummy_operator import DummyOperator
+try:
+    from airflow.operators.empty import EmptyOperator
+except ImportError:  # Airflow < 2.3
+    from airflow.operators.dummy_operator import DummyOperator as EmptyOperator
 from airflow.operators.python_operator import PythonOperator, BranchPythonOperator
-from airflow.contrib.operators.spark_submit_operator import SparkSubmitOperator
+from airflow.exceptions import AirflowException
 from datetime import datetime, timedelta
 
 ###############################################
 # Parameters
 ###############################################
-spark_conn = os.environ.get("spark_conn", "spark_conn")
-spark_master = "spark://spark:7077"
-postgres_driver_jar = "/usr/local/spark/assets/jars/postgresql-42.2.6.jar"
+# โฟลเดอร์ของ collector scripts (mount เข้า container ของ Airflow ด้วย)
+applications_dir = "/usr/local/spark/applications"
 
 # Database connection parameters
 postgres_db = "jdbc:postgresql://postgres:5432/airflow"
@@ -91,6 +92,35 @@ dag = DAG(
     tags=["mot", "rain", "day-type", "quality-checks", "branching", "xcom", "v2", "production"]
 )
 
+###############################################
+# Collection Functions
+###############################################
+
+def run_collector(module_name):
+    """
+    รัน main() ของ collector script ใน process ของ Airflow โดยตรง
+    (scripts เป็น pandas/psycopg2 ธรรมดา ไม่ต้องใช้ Spark/JVM)
+    """
+    import sys
+    import importlib
+    
+    if applications_dir not in sys.path:
+        sys.path.insert(0, applications_dir)
+    module = importlib.import_module(module_name)
+    
+    # ส่ง args แบบเดียวกับ spark-submit (main() อ่านจาก sys.argv)
+    original_argv = sys.argv
+    sys.argv = [module.__file__, postgres_db, postgres_user, postgres_pwd]
+    try:
+        success = module.main()
+    finally:
+        sys.argv = original_argv
+    
+    if not success:
+        raise AirflowException(f"{module_name}.main() ล้มเหลว")
+    return success
+
+
 ###############################################
 # Quality Check Functions
 ###############################################
@@ -127,44 +157,9 @@ def check_mot_data_quality(**context):
     }
     
     try:
-        # 1. นับจำนวน records ที่เพิ่งอัปเดต
-        cur.execute("""
-            SELECT COUNT(*) FROM features 
-            WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-        """)
-        quality_check["records_processed"] = cur.fetchone()[0]
-        
-        # 2. ตรวจสอบ Missing data และ Zero values ในแต่ละสาย
         transport_columns = ['arl', 'bts', 'mrt_blue', 'mrt_purple', 'mrt_pink', 'srt_red', 'mrt_yellow']
         
-        for column in transport_columns:
-            # Missing หรือ NULL values
-            cur.execute(f"""
-                SELECT feature_date FROM features 
-                WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-                AND {column} IS NULL
-                ORDER BY feature_date
-            """)
-            null_dates = [str(row[0]) for row in cur.fetchall()]
-            
-            # Zero values (น่าสงสัย - ระบบขนส่งไม่น่าจะมีผู้โดยสาร 0)
-            cur.execute(f"""
-                SELECT feature_date FROM features 
-                WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-                AND {column} = 0
-                ORDER BY feature_date
-            """)
-            zero_dates = [str(row[0]) for row in cur.fetchall()]
-            
-            if null_dates or zero_dates:
-                issues = []
-                if null_dates:
-                    issues.extend([f"{date} (NULL)" for date in null_dates])
-                if zero_dates:
-                    issues.extend([f"{date} (ZERO)" for date in zero_dates])
-                quality_check["missing_data"][column] = issues
-        
-        # 3. ตรวจสอบ Anomalies (ค่าสูงผิดปกติ) - ปรับตาม realistic values
+        # Anomalies (ค่าสูงผิดปกติ) - ปรับตาม realistic values
         anomaly_thresholds = {
             'bts': 2000000,        # BTS อาจมีผู้โดยสาร 1-2 ล้าน/วัน (ปกติ)
             'mrt_blue': 1500000,   # MRT สายน้ำเงินค่อนข้างคึกคัก
@@ -175,19 +170,56 @@ def check_mot_data_quality(**context):
             'mrt_pink': 400000     # MRT สายชมพูใหม่ๆ
         }
         
-        for column in transport_columns:
-            threshold = anomaly_thresholds.get(column, 1000000)  # default 1M
-            cur.execute(f"""
-                SELECT feature_date, {column} FROM features 
+        # 1-3. นับ records และหา NULL / Zero / Anomaly ของทุกสายใน query เดียว
+        # (แตกแต่ละคอลัมน์เป็นแถว (สาย, ค่า) แล้วกรองเฉพาะแถวที่มีปัญหา)
+        # feature_date ส่งกลับเป็น text จาก PostgreSQL เลย ไม่ต้องแปลง str() ทีละแถว
+        column_values = ", ".join(
+            f"({i}, '{column}', {column}::float8, {anomaly_thresholds.get(column, 1000000)})"  # default 1M
+            for i, column in enumerate(transport_columns)
+        )
+        cur.execute(f"""
+            WITH recent AS (
+                SELECT * FROM features 
                 WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-                AND ({column} > {threshold} OR {column} < 0)  -- เกิน threshold หรือติดลบ
-            """)
-            anomalies = cur.fetchall()
-            for date, value in anomalies:
-                if value < 0:
-                    quality_check["anomalies"].append(f"{column} = {value:,.0f} (negative) on {date}")
-                else:
-                    quality_check["anomalies"].append(f"{column} = {value:,.0f} (>{threshold:,}) on {date}")
+            ), issues AS (
+                SELECT v.idx, v.col, r.feature_date, v.val, v.threshold 
+                FROM recent r 
+                CROSS JOIN LATERAL (VALUES {column_values}) AS v(idx, col, val, threshold) 
+                WHERE v.val IS NULL OR v.val = 0 
+                   OR v.val > v.threshold OR v.val < 0  -- เกิน threshold หรือติดลบ
+            )
+            SELECT (SELECT COUNT(*) FROM recent), i.col, i.feature_date::text, i.val, i.threshold 
+            FROM (SELECT 1) AS one 
+            LEFT JOIN issues i ON TRUE 
+            ORDER BY i.idx, i.feature_date
+        """)
+        rows = cur.fetchall()
+        quality_check["records_processed"] = rows[0][0]
+        
+        null_dates = {column: [] for column in transport_columns}
+        zero_dates = {column: [] for column in transport_columns}
+        for _, column, date, value, threshold in rows:
+            if column is None:
+                continue
+            if value is None:
+                # Missing หรือ NULL values
+                null_dates[column].append(date)
+            elif value == 0:
+                # Zero values (น่าสงสัย - ระบบขนส่งไม่น่าจะมีผู้โดยสาร 0)
+                zero_dates[column].append(date)
+            elif value < 0:
+                quality_check["anomalies"].append(f"{column} = {value:,.0f} (negative) on {date}")
+            else:
+                quality_check["anomalies"].append(f"{column} = {value:,.0f} (>{threshold:,}) on {date}")
+        
+        for column in transport_columns:
+            if null_dates[column] or zero_dates[column]:
+                issues = []
+                if null_dates[column]:
+                    issues.extend([f"{date} (NULL)" for date in null_dates[column]])
+                if zero_dates[column]:
+                    issues.extend([f"{date} (ZERO)" for date in zero_dates[column]])
+                quality_check["missing_data"][column] = issues
         
         # 4. คำนวณ Quality Score
         total_expected_records = 7 * len(transport_columns)  # 7 วัน × 7 สาย
@@ -231,11 +263,11 @@ def check_mot_data_quality(**context):
     # ส่งผลลัพธ์ผ่าน XCom
     context['task_instance'].xcom_push(key='mot_quality_result', value=quality_check)
     
-    # Return branch decision
+    # Return branch decision (Rain และ Day Type ไม่ขึ้นต่อกัน จึงรันคู่ขนานได้)
     if quality_check["status"] == "FAIL":
         return "mot_quality_failed"
     else:
-        return "collect_rain_weather_data"
+        return ["collect_rain_weather_data", "collect_day_type_data"]
 
 
 def check_rain_data_quality(**context):
@@ -261,21 +293,15 @@ def check_rain_data_quality(**context):
     }
     
     try:
-        # 1. ตรวจสอบ records ที่ยังเป็น NULL
-        cur.execute("""
-            SELECT COUNT(*) FROM features 
-            WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-            AND rain_average IS NULL
-        """)
-        quality_check["null_rain_remaining"] = cur.fetchone()[0]
-        
-        # 2. นับ records ที่มี rain data
+        # 1-2. นับ records ที่ยังเป็น NULL และที่มี rain data ใน scan เดียว
         cur.execute("""
-            SELECT COUNT(*) FROM features 
+            SELECT 
+                COUNT(*) FILTER (WHERE rain_average IS NULL), 
+                COUNT(*) FILTER (WHERE rain_average IS NOT NULL) 
+            FROM features 
             WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-            AND rain_average IS NOT NULL
         """)
-        quality_check["records_processed"] = cur.fetchone()[0]
+        quality_check["null_rain_remaining"], quality_check["records_processed"] = cur.fetchone()
         
         # 3. ตรวจสอบค่าฝนผิดปกติ
         cur.execute("""
@@ -320,7 +346,7 @@ def check_rain_data_quality(**context):
     if quality_check["status"] == "FAIL":
         return "rain_quality_failed"
     else:
-        return "collect_day_type_data"
+        return "join_quality_checks"
 
 
 def check_day_type_data_quality(**context):
@@ -341,30 +367,24 @@ def check_day_type_data_quality(**context):
     }
     
     try:
-        # 1. ตรวจสอบ day_type ที่ยังเป็น -1
-        cur.execute("""
-            SELECT COUNT(*) FROM features 
-            WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-            AND day_type = -1
-        """)
-        quality_check["pending_day_type_remaining"] = cur.fetchone()[0]
-        
-        # 2. นับ records ที่มี day_type แล้ว
+        # 1-3. นับ day_type ที่ยังเป็น -1 / ที่มีค่าแล้ว และตรวจ Logic Validation ใน query เดียว
+        # (วันเสาร์-อาทิตย์ควรเป็น day_type = 1 หรือ 2)
         cur.execute("""
-            SELECT COUNT(*) FROM features 
+            SELECT 
+                COUNT(*) FILTER (WHERE day_type = -1), 
+                COUNT(*) FILTER (WHERE day_type != -1), 
+                COALESCE(
+                    json_agg(json_build_array(feature_date::text, day_type, dow) ORDER BY feature_date) 
+                        FILTER (WHERE dow IN (6, 0) AND day_type NOT IN (1, 2)),  -- เสาร์, อาทิตย์ ควรเป็นวันหยุด
+                    '[]'::json
+                ) 
+            FROM features 
             WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-            AND day_type != -1
         """)
-        quality_check["records_processed"] = cur.fetchone()[0]
+        pending, processed, weekend_errors = cur.fetchone()
+        quality_check["pending_day_type_remaining"] = pending
+        quality_check["records_processed"] = processed
         
-        # 3. ตรวจสอบ Logic Validation (วันเสาร์-อาทิตย์ควรเป็น day_type = 1)
-        cur.execute("""
-            SELECT feature_date, day_type, dow FROM features 
-            WHERE feature_date >= CURRENT_DATE - INTERVAL '7 days'
-            AND dow IN (6, 0)  -- เสาร์, อาทิตย์
-            AND day_type NOT IN (1, 2)  -- ควรเป็นวันหยุด
-        """)
-        weekend_errors = cur.fetchall()
         for date, day_type, dow in weekend_errors:
             day_name = "Saturday" if dow == 6 else "Sunday"
             quality_check["classification_errors"].append(f"{day_name} {date} classified as day_type={day_type}")
@@ -405,7 +425,7 @@ def check_day_type_data_quality(**context):
     if quality_check["status"] == "FAIL":
         return "day_type_quality_failed"
     else:
-        return "final_quality_validation"
+        return "join_quality_checks"
 
 
 def generate_final_report(**context):
@@ -465,30 +485,17 @@ def generate_final_report(**context):
 ###############################################
 
 # Start task
-start_task = DummyOperator(
+start_task = EmptyOperator(
     task_id="start_weekly_data_collection",
     dag=dag
 )
 
 
 # MOT data collection task - ใจกลางของ workflow (ใช้ functional version)
-mot_data_collection = SparkSubmitOperator(
+mot_data_collection = PythonOperator(
     task_id="collect_mot_transport_data",
-    application="/usr/local/spark/applications/mot_collecting.py",  # Functional version
-    name="mot-data-collector-functional",
-    conn_id=spark_conn,
-    verbose=1,
-    conf={
-        # Simplified Spark configuration for Python script
-        "spark.master": spark_master,
-        "spark.executor.memory": "1g",
-        "spark.driver.memory": "1g",
-        "spark.driver.extraClassPath": postgres_driver_jar,
-        "spark.executor.extraClassPath": postgres_driver_jar
-    },
-    application_args=[postgres_db, postgres_user, postgres_pwd],  # ส่ง args ไปยัง script
-    jars=postgres_driver_jar,
-    driver_class_path=postgres_driver_jar,
+    python_callable=run_collector,
+    op_args=["mot_collecting"],  # Functional version
     dag=dag,
 )
 
@@ -500,23 +507,10 @@ mot_quality_check = BranchPythonOperator(
 )
 
 # Rain data collection task - ทำงานต่อเมื่อ MOT quality ผ่าน
-rain_data_collection = SparkSubmitOperator(
+rain_data_collection = PythonOperator(
     task_id="collect_rain_weather_data",
-    application="/usr/local/spark/applications/rain_collecting.py",  # Rain functional version
-    name="rain-data-collector-functional",
-    conn_id=spark_conn,
-    verbose=1,
-    conf={
-        # Simplified Spark configuration for Python script
-        "spark.master": spark_master,
-        "spark.executor.memory": "1g",
-        "spark.driver.memory": "1g",
-        "spark.driver.extraClassPath": postgres_driver_jar,
-        "spark.executor.extraClassPath": postgres_driver_jar
-    },
-    application_args=[postgres_db, postgres_user, postgres_pwd],  # ส่ง args ไปยัง script
-    jars=postgres_driver_jar,
-    driver_class_path=postgres_driver_jar,
+    python_callable=run_collector,
+    op_args=["rain_collecting"],  # Rain functional version
     trigger_rule="none_failed_min_one_success",  # รันได้แม้ upstream จะถูก SKIP
     dag=dag,
 )
@@ -528,24 +522,11 @@ rain_quality_check = BranchPythonOperator(
     dag=dag,
 )
 
-# Day type data collection task - ทำงานต่อเมื่อ Rain quality ผ่าน
-day_type_data_collection = SparkSubmitOperator(
+# Day type data collection task - ทำงานคู่ขนานกับ Rain เมื่อ MOT quality ผ่าน
+day_type_data_collection = PythonOperator(
     task_id="collect_day_type_data",
-    application="/usr/local/spark/applications/day_type_collecting.py",  # Day type functional version
-    name="day-type-data-collector-functional",
-    conn_id=spark_conn,
-    verbose=1,
-    conf={
-        # Simplified Spark configuration for Python script
-        "spark.master": spark_master,
-        "spark.executor.memory": "1g",
-        "spark.driver.memory": "1g",
-        "spark.driver.extraClassPath": postgres_driver_jar,
-        "spark.executor.extraClassPath": postgres_driver_jar
-    },
-    application_args=[postgres_db, postgres_user, postgres_pwd],  # ส่ง args ไปยัง script
-    jars=postgres_driver_jar,
-    driver_class_path=postgres_driver_jar,
+    python_callable=run_collector,
+    op_args=["day_type_collecting"],  # Day type functional version
     trigger_rule="none_failed_min_one_success",  # รันได้แม้ upstream จะถูก SKIP
     dag=dag,
 )
@@ -557,6 +538,14 @@ day_type_quality_check = BranchPythonOperator(
     dag=dag,
 )
 
+# Join - รอให้ Rain และ Day Type quality ผ่านทั้งคู่
+# (all_success: ถ้า branch ใดไป *_quality_failed งานนี้จะถูก SKIP และไม่ไปต่อ)
+join_quality_checks = EmptyOperator(
+    task_id="join_quality_checks",
+    trigger_rule="all_success",
+    dag=dag
+)
+
 # Final Quality Validation - สร้างรายงานสรุป
 final_quality_validation = PythonOperator(
     task_id="final_quality_validation",
@@ -566,30 +555,30 @@ final_quality_validation = PythonOperator(
 )
 
 # Success/Failure endpoints
-pipeline_success = DummyOperator(
+pipeline_success = EmptyOperator(
     task_id="pipeline_success",
     trigger_rule="none_failed_min_one_success",  # รันได้แม้ upstream จะถูก SKIP
     dag=dag
 )
 
 # Quality Check Failed Tasks
-mot_quality_failed = DummyOperator(
+mot_quality_failed = EmptyOperator(
     task_id="mot_quality_failed",
     dag=dag
 )
 
-rain_quality_failed = DummyOperator(
+rain_quality_failed = EmptyOperator(
     task_id="rain_quality_failed", 
     dag=dag
 )
 
-day_type_quality_failed = DummyOperator(
+day_type_quality_failed = EmptyOperator(
     task_id="day_type_quality_failed",
     dag=dag
 )
 
 # End task
-end_task = DummyOperator(
+end_task = EmptyOperator(
     task_id="end_weekly_data_collection",
     trigger_rule="none_failed_min_one_success",  # รันได้แม้จะมี paths ที่ถูก SKIP
     dag=dag
@@ -601,8 +590,8 @@ end_task = DummyOperator(
 
 # Define the comprehensive data collection workflow with Quality Checks & Branching
 # 
-# Flow: Start → MOT Collection → MOT Quality Check → Rain Collection → Rain Quality Check 
-#       → Day Type Collection → Day Type Quality Check → Final Validation → Success → End
+# Flow: Start → MOT Collection → MOT Quality Check → (Rain Collection → Rain Quality Check 
+#       || Day Type Collection → Day Type Quality Check) → Join → Final Validation → Success → End
 #       
 # Quality Check Branching: Each stage can branch to PASS (continue) or FAIL (end pipeline)
 # 
@@ -611,10 +600,13 @@ end_task = DummyOperator(
 # 3. MOT Quality Check: Validate MOT data completeness, detect anomalies (BranchPythonOperator)
 # 4. Rain Collection: Fill rain_average for records where it's NULL (if MOT quality passes)
 # 5. Rain Quality Check: Validate rain data coverage and values (BranchPythonOperator)
-# 6. Day Type Collection: Fill day_type for records where it's -1 (if Rain quality passes)
+# 6. Day Type Collection: Fill day_type for records where it's -1 (in parallel with Rain)
 # 7. Day Type Quality Check: Validate day type classifications (BranchPythonOperator)  
-# 8. Final Validation: Generate comprehensive quality report (PythonOperator with XCom)
-# 9. Success/End: Complete the workflow with fully validated features table
+# 8. Join: Continue only when both Rain and Day Type quality checks pass
+# 9. Final Validation: Generate comprehensive quality report (PythonOperator with XCom)
+# 10. Success/End: Complete the workflow with fully validated features table
+#
+# Rain และ Day Type อัพเดตคนละคอลัมน์ (rain_average / day_type) จึงรันพร้อมกันได้
 # 
 # XCom Usage: Quality metrics and results are shared between tasks for comprehensive reporting
 
@@ -631,37 +623,36 @@ end_task = DummyOperator(
 #
 # Flow Diagram:
 #
-# start_task → mot_data_collection → mot_quality_check → [collect_rain_weather_data | mot_quality_failed]
-#                                                       ↓                           ↓
-#                                            rain_quality_check → [collect_day_type_data | rain_quality_failed]
-#                                                                 ↓                        ↓
-#                                                     day_type_quality_check → [final_quality_validation | day_type_quality_failed]
-#                                                                              ↓                           ↓
-#                                                                    pipeline_success → end_task ← ALL FAILED PATHS
+# start_task → mot_data_collection → mot_quality_check → [collect_rain_weather_data + collect_day_type_data | mot_quality_failed]
+#
+#   collect_rain_weather_data → rain_quality_check         → [join_quality_checks | rain_quality_failed]
+#   collect_day_type_data     → day_type_quality_check     → [join_quality_checks | day_type_quality_failed]
+#
+# join_quality_checks → final_quality_validation → pipeline_success → end_task ← ALL FAILED PATHS
 
 # Main pipeline flow:
 start_task >> mot_data_collection >> mot_quality_check
 
-# MOT Quality Check branches (BranchPythonOperator returns either task_id)
-mot_quality_check >> rain_data_collection
+# MOT Quality Check branches (BranchPythonOperator returns Rain + Day Type together, or the failed task_id)
+mot_quality_check >> [rain_data_collection, day_type_data_collection]
 mot_quality_check >> mot_quality_failed
 
 # Rain pipeline continuation
 rain_data_collection >> rain_quality_check
 
 # Rain Quality Check branches (BranchPythonOperator returns either task_id)  
-rain_quality_check >> day_type_data_collection
+rain_quality_check >> join_quality_checks
 rain_quality_check >> rain_quality_failed
 
 # Day Type pipeline continuation
 day_type_data_collection >> day_type_quality_check
 
 # Day Type Quality Check branches (BranchPythonOperator returns either task_id)
-day_type_quality_check >> final_quality_validation
+day_type_quality_check >> join_quality_checks
 day_type_quality_check >> day_type_quality_failed
 
 # Final success path
-final_quality_validation >> pipeline_success >> end_task
+join_quality_checks >> final_quality_validation >> pipeline_success >> end_task
 
 # All failed paths lead to end_task
 mot_quality_failed >> end_task
@@ -689,5 +680,5 @@ day_type_quality_failed >> end_task
 #   * ขั้นที่ 2 (Rain): เติม rain_average สำหรับวันที่ที่เป็น NULL
 #   * ตรวจสอบวันที่ล่าสุดในฐานข้อมูล
 #   * ดึงเฉพาะข้อมูลใหม่จาก APIs
-#   * การทำงานต่อเนื่อง: MOT → Rain → Validation
+#   * การทำงานต่อเนื่อง: MOT → (Rain || Day Type) → Validation
 #   * Upsert ข้อมูลแบบ intelligent
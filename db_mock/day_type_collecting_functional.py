@@ -1,70 +1,15 @@
 import os 
 import time
 import pandas as pd
+import numpy as np
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 import calendar
-
-now = time.localtime()
-current_year = now.tm_year + 543  # Convert to Buddhist year (2568)
-christian_year = now.tm_year  # Christian year (2025)
-download_url = f"https://www.myhora.com/calendar/ical/holiday.aspx?{current_year}.csv"
-
-folder = f'./'
-csv_filename = f'myhora-holiday-calendar-{current_year}.csv'
-print(f"Current Buddhist Year: {current_year}")
-print(f"Current Christian Year: {christian_year}")
-
-# Create folder if not exists
-if not os.path.exists(folder):
-    os.makedirs(folder)
-
-csv_path = os.path.join(folder, csv_filename)
-
-# Download holiday calendar if not already present
-if not os.path.exists(csv_path):
-    print("Downloading holiday calendar...")
-    try:
-        response = requests.get(download_url)
-        response.raise_for_status()
-        
-        with open(csv_path, 'wb') as f:
-            f.write(response.content)
-        print(f"Holiday calendar downloaded: {csv_path}")
-    except Exception as e:
-        print(f"Failed to download holiday calendar: {e}")
-        # Create empty DataFrame if download fails
-        holiday_df = pd.DataFrame(columns=['Start Date', 'Summary'])
-else:
-    print(f"Using existing holiday calendar: {csv_path}")
-
-# Read holiday data
-try:
-    holiday_df = pd.read_csv(csv_path, encoding='utf-8-sig')
-    print("Holiday data loaded successfully")
-    print(f"Columns: {holiday_df.columns.tolist()}")
-    if len(holiday_df) > 0:
-        print(f"Sample holiday data:\n{holiday_df.head()}")
-except Exception as e:
-    print(f"Error reading holiday file: {e}")
-    # Create empty DataFrame if file reading fails
-    holiday_df = pd.DataFrame(columns=['Start Date', 'Summary'])
-
-# Define date range: 2025-09-04 to 2025-09-30
-start_date = datetime(2025, 9, 4)
-end_date = datetime(2025, 9, 30)
-
-# Generate all dates in range
-date_range = []
-current_date = start_date
-while current_date <= end_date:
-    date_range.append(current_date)
-    current_date += timedelta(days=1)
-
-print(f"\nDate range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
-print(f"Total days: {len(date_range)}")
+from functools import lru_cache
+from email.utils import formatdate
 
 # Define festivals (priority 2)
+@lru_cache(maxsize=128)
 def get_second_saturday(year, month):
     """Get the second Saturday of a given month and year"""
     cal = calendar.monthcalendar(year, month)
@@ -80,107 +25,158 @@ def get_second_saturday(year, month):
             second_saturday = cal[2][calendar.SATURDAY]
     return f"{year:04d}-{month:02d}-{second_saturday:02d}"
 
-second_sat_jan = get_second_saturday(christian_year, 1)
-
-festivals = [
-    ("วันเด็ก", second_sat_jan),
-    ("วาเลนไทน์", f"{christian_year}-02-14"),
-    ("สงกรานต์", f"{christian_year}-04-13"),
-    ("สงกรานต์", f"{christian_year}-04-14"), 
-    ("สงกรานต์", f"{christian_year}-04-15"),
-    ("คริสต์มาสอีฟ", f"{christian_year}-12-24"),
-    ("คริสต์มาส", f"{christian_year}-12-25"),
-    ("วันสิ้นปี", f"{christian_year}-12-31"),
-]
-
-print("\nDefined festivals:")
-for name, date in festivals:
-    print(f"  {name}: {date}")
-
-# Convert holiday dates to set for quick lookup
-holiday_dates = set()
-if len(holiday_df) > 0 and 'Start Date' in holiday_df.columns:
-    for _, row in holiday_df.iterrows():
-        try:
-            # Handle different date formats
-            date_str = str(row['Start Date']).strip()
-            if len(date_str) == 8:  # Format: 20250101
-                date_obj = datetime.strptime(date_str, '%Y%m%d')
-                holiday_dates.add(date_obj.strftime('%Y-%m-%d'))
-            elif '-' in date_str:  # Format: 2025-01-01
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                holiday_dates.add(date_obj.strftime('%Y-%m-%d'))
-        except Exception as e:
-            continue
-
-print(f"\nLoaded {len(holiday_dates)} holidays")
-
-# Convert festival dates to set
-festival_dates = set()
-for name, date in festivals:
-    festival_dates.add(date)
-
-print(f"Defined {len(festival_dates)} festival dates")
-
-# Create day type mapping
-day_type_data = []
-
-for date_obj in date_range:
-    date_str = date_obj.strftime('%Y-%m-%d')
-    
+@lru_cache(maxsize=None)
+def build_festivals(year):
+    """Return the (name, 'YYYY-MM-DD') festival pairs for a given year (cached per year)"""
+    return (
+        ("วันเด็ก", get_second_saturday(year, 1)),
+        ("วาเลนไทน์", f"{year}-02-14"),
+        ("สงกรานต์", f"{year}-04-13"),
+        ("สงกรานต์", f"{year}-04-14"), 
+        ("สงกรานต์", f"{year}-04-15"),
+        ("คริสต์มาสอีฟ", f"{year}-12-24"),
+        ("คริสต์มาส", f"{year}-12-25"),
+        ("วันสิ้นปี", f"{year}-12-31"),
+    )
+
+def main():
+    """Download the holiday calendar and build the day type mapping CSV"""
+    now = time.localtime()
+    current_year = now.tm_year + 543  # Convert to Buddhist year (2568)
+    christian_year = now.tm_year  # Christian year (2025)
+    download_url = f"https://www.myhora.com/calendar/ical/holiday.aspx?{current_year}.csv"
+
+    folder = f'./'
+    csv_filename = f'myhora-holiday-calendar-{current_year}.csv'
+    print(f"Current Buddhist Year: {current_year}")
+    print(f"Current Christian Year: {christian_year}")
+
+    # Create folder if not exists
+    os.makedirs(folder, exist_ok=True)
+
+    csv_path = os.path.join(folder, csv_filename)
+
+    # Download holiday calendar (conditional request if we already have a copy)
+    headers = {}
+    if os.path.exists(csv_path):
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(csv_path), usegmt=True)
+
+    print("Downloading holiday calendar...")
+    # Stream to a temp file and swap it in, so a failed download never leaves a partial CSV
+    tmp_path = csv_path + '.part'
+    try:
+        with requests.get(download_url, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 304:
+                print(f"Using existing holiday calendar (not modified): {csv_path}")
+            else:
+                response.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(65536):
+                        f.write(chunk)
+                os.replace(tmp_path, csv_path)
+                print(f"Holiday calendar downloaded: {csv_path}")
+    except Exception as e:
+        print(f"Failed to download holiday calendar: {e}")
+        if os.path.exists(csv_path):
+            print(f"Using existing holiday calendar: {csv_path}")
+    finally:
+        # Remove any partial download left behind by a failed stream
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Read holiday data
+    try:
+        holiday_df = pd.read_csv(csv_path, encoding='utf-8-sig')
+        print("Holiday data loaded successfully")
+        print(f"Columns: {holiday_df.columns.tolist()}")
+        if len(holiday_df) > 0:
+            print(f"Sample holiday data:\n{holiday_df.head()}")
+    except Exception as e:
+        print(f"Error reading holiday file: {e}")
+        # Create empty DataFrame if file reading fails
+        holiday_df = pd.DataFrame(columns=['Start Date', 'Summary'])
+
+    # Define date range: 2025-09-04 to 2025-09-30
+    start_date = datetime(2025, 9, 4)
+    end_date = datetime(2025, 9, 30)
+
+    # Generate all dates in range
+    date_range = pd.date_range(start_date, end_date, freq='D')
+
+    print(f"\nDate range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
+    print(f"Total days: {len(date_range)}")
+
+    festivals = build_festivals(christian_year)
+
+    print("\nDefined festivals:")
+    for name, date in festivals:
+        print(f"  {name}: {date}")
+
+    # Convert holiday dates to set for quick lookup
+    holiday_dates = set()
+    if len(holiday_df) > 0 and 'Start Date' in holiday_df.columns:
+        # Handle different date formats (20250101 or 2025-01-01) in one vectorized pass
+        start_dates = holiday_df['Start Date'].astype(str).str.strip()
+        parsed = pd.to_datetime(start_dates, format='%Y%m%d', errors='coerce')
+        parsed = parsed.fillna(pd.to_datetime(start_dates, format='%Y-%m-%d', errors='coerce'))
+        holiday_dates = set(parsed.dropna().dt.strftime('%Y-%m-%d'))
+
+    print(f"\nLoaded {len(holiday_dates)} holidays")
+
+    # Convert festival dates to set
+    festival_dates = frozenset(date for _, date in festivals)
+
+    print(f"Defined {len(festival_dates)} festival dates")
+
+    # Create day type mapping (vectorized over the whole date range)
+    date_strs = date_range.strftime('%Y-%m-%d').to_numpy()
+    is_holiday = np.isin(date_strs, list(holiday_dates))
+    is_festival = np.isin(date_strs, list(festival_dates))
+
     # Priority 1: Holiday (0) - highest priority
-    if date_str in holiday_dates:
-        day_type = 0
-        day_category = "Holiday"
-    # Priority 2: Festival (2) - second priority  
-    elif date_str in festival_dates:
-        day_type = 2
-        day_category = "Festival"
+    # Priority 2: Festival (2) - second priority
     # Priority 3: Normal day including weekends (1) - lowest priority
-    else:
-        day_type = 1
-        day_category = "Normal/Weekend"
-    
-    # Additional info
-    weekday = date_obj.strftime('%A')
-    is_weekend = date_obj.weekday() >= 5  # Saturday=5, Sunday=6
-    
-    day_type_data.append({
-        'date': date_str,
+    day_type = np.where(is_holiday, 0, np.where(is_festival, 2, 1))
+    day_category = np.where(is_holiday, "Holiday", np.where(is_festival, "Festival", "Normal/Weekend"))
+
+    # Create DataFrame
+    day_type_df = pd.DataFrame({
+        'date': date_strs,
         'day_type': day_type,
         'day_category': day_category,
-        'weekday': weekday,
-        'is_weekend': is_weekend,
-        'day_of_month': date_obj.day,
-        'month': date_obj.month,
-        'year': date_obj.year
+        'weekday': date_range.day_name(),
+        'is_weekend': date_range.weekday >= 5,  # Saturday=5, Sunday=6
+        'day_of_month': date_range.day,
+        'month': date_range.month,
+        'year': date_range.year
     })
 
-# Create DataFrame
-day_type_df = pd.DataFrame(day_type_data)
-
-print(f"\nDay type mapping for September 2025:")
-print(day_type_df)
-
-# Summary statistics
-print(f"\nSummary:")
-day_type_counts = day_type_df['day_category'].value_counts()
-for category, count in day_type_counts.items():
-    print(f"  {category}: {count} days")
-
-# Save to CSV
-output_file = "day_type_mapping_sep2025.csv"
-day_type_df.to_csv(output_file, index=False)
-print(f"\nDay type mapping saved to: {output_file}")
-
-# Show specific examples
-print(f"\nExamples:")
-for day_type in [0, 1, 2]:
-    examples = day_type_df[day_type_df['day_type'] == day_type].head(3)
-    if len(examples) > 0:
-        type_name = examples.iloc[0]['day_category']
-        print(f"  {type_name} (type {day_type}):")
-        for _, row in examples.iterrows():
-            print(f"    {row['date']} ({row['weekday']})")
-
-print(f"\nMapping completed successfully!")
\ No newline at end of file
+    print(f"\nDay type mapping for September 2025:")
+    print(day_type_df)
+
+    # Summary statistics
+    print(f"\nSummary:")
+    day_type_counts = day_type_df['day_category'].value_counts()
+    for category, count in day_type_counts.items():
+        print(f"  {category}: {count} days")
+
+    # Save to CSV
+    output_file = "day_type_mapping_sep2025.csv"
+    day_type_df.to_csv(output_file, index=False)
+    print(f"\nDay type mapping saved to: {output_file}")
+
+    # Show specific examples
+    print(f"\nExamples:")
+    for day_type in [0, 1, 2]:
+        examples = day_type_df[day_type_df['day_type'] == day_type].head(3)
+        if len(examples) > 0:
+            type_name = examples.iloc[0]['day_category']
+            print(f"  {type_name} (type {day_type}):")
+            for _, row in examples.iterrows():
+                print(f"    {row['date']} ({row['weekday']})")
+
+    print(f"\nMapping completed successfully!")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,28 @@ Current situation:
 - Query: September + October 2025
 """
 
-import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
+import io
+import re
 import sys
-from typing import Optional, Dict, List, Any
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Any, Tuple
+
+# orjson เร็วกว่า json มาตรฐานมาก แต่ไม่ได้ติดตั้งในทุก environment
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
 
 # Database configuration
 DB_CONFIG = {
@@ -27,69 +43,147 @@ DB_CONFIG = {
     "password": "airflow"
 }
 
+# คอลัมน์ที่ใช้จริงจาก MOT API และจำนวนแถวต่อหน้า
+MOT_FIELDS = "วันที่,ปริมาณ,ยานพาหนะ/ท่า"
+MOT_PAGE_LIMIT = 10000
+
+# กลุ่มคำสำคัญสำหรับแต่ละสาย (ใช้ merge คอลัมน์ที่เขียนไม่สม่ำเสมอ)
+LINE_GROUPS = {
+    'ARL': ['arl', 'ARL', 'สุวรรณภูมิ'],
+    'BTS': ['bts', 'BTS', 'ลูกฟูก'],
+    'น้ำเงิน': ['น้ำเงิน', 'นำเงิน', 'น้าเงิน', 'สีน้ำเงิน'],
+    'ม่วง': ['ม่วง', 'มวง', 'สีม่วง'],
+    'ชมพู': ['ชมพู', 'ชมพูู', 'ชมพุ', 'สีชมพู'],
+    'แดง': ['แดง', 'แดง', 'สีแดง', 'ชานเมือง'],
+    'เหลือง': ['เหลือง', 'เหลืง', 'สีเหลือง']
+}
+LINE_PATTERNS = {
+    line_key: re.compile('|'.join(map(re.escape, keywords)))
+    for line_key, keywords in LINE_GROUPS.items()
+}
+
+# Connection pool - สร้างครั้งแรกที่ใช้งาน แล้วใช้ซ้ำตลอดอายุ process
+_POOL: Optional[ThreadedConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool() -> ThreadedConnectionPool:
+    """คืน connection pool ของ module (สร้างใหม่ถ้ายังไม่มี)"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadedConnectionPool(minconn=1, maxconn=4, **DB_CONFIG)
+            atexit.register(_POOL.closeall)
+    return _POOL
+
+@contextmanager
+def _conn():
+    """ยืม connection จาก pool และคืนกลับเมื่อใช้งานเสร็จ"""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 def get_latest_date_from_db() -> Optional[date]:
     """ตรวจสอบวันที่ล่าสุดในฐานข้อมูล"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        cur.execute("SELECT MAX(feature_date) FROM features;")
-        result = cur.fetchone()
-        latest_date = result[0] if result[0] else None
-        
-        cur.close()
-        conn.close()
+        with _conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT MAX(feature_date) FROM features;")
+            result = cur.fetchone()
+            latest_date = result[0] if result[0] else None
         
         return latest_date
     except Exception as e:
         print(f"❌ Error getting latest date: {e}")
         return None
 
-def fetch_mot_data_for_months(year: int, months: List[int]) -> Optional[List[Dict[str, Any]]]:
-    """ดึงข้อมูล MOT API สำหรับเดือนที่ระบุ"""
-    url = "https://datagov.mot.go.th/api/action/datastore_search"
-    all_records = []
+# HTTP session ใช้ซ้ำ (keep-alive) สำหรับเรียก MOT API
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5)
+))
+
+def _fetch_mot_month(url: str, query_month: str) -> Optional[List[Dict[str, Any]]]:
+    """ดึงข้อมูล MOT API ของเดือนเดียว (ขอเฉพาะคอลัมน์ที่ใช้ และแบ่งหน้าด้วย offset)"""
+    print(f"🔍 กำลังค้นหาเดือน: {query_month}")
+    
+    params = {
+        "resource_id": "a139ab23-602f-4c0d-8789-4d230bcdf33d",
+        "q": f"{query_month}",
+        "fields": MOT_FIELDS,
+        "limit": MOT_PAGE_LIMIT,
+        "offset": 0
+    }
+    records = []
     
-    for month in months:
-        query_month = f"{year}-{month:02d}"
-        print(f"🔍 กำลังค้นหาเดือน: {query_month}")
-        
-        params = {
-            "resource_id": "a139ab23-602f-4c0d-8789-4d230bcdf33d",
-            "q": f"{query_month}",
-            "limit": 10000
-        }
-        
-        try:
-            response = requests.get(url, params=params)
+    try:
+        while True:
+            response = _SESSION.get(url, params=params, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            data = _json_loads(response.content)
             
             if 'result' not in data or 'records' not in data['result']:
                 print(f"❌ ไม่พบข้อมูลในเดือน {query_month}")
-                continue
+                return None
             
-            records = data['result']['records']
-            print(f"📊 เดือน {query_month}: ดึงข้อมูลได้ {len(records)} รายการ")
-            all_records.extend(records)
+            page = data['result']['records']
+            records.extend(page)
+            
+            # หน้าไม่เต็ม limit แปลว่าเป็นหน้าสุดท้าย
+            if len(page) < MOT_PAGE_LIMIT:
+                break
+            params["offset"] += MOT_PAGE_LIMIT
         
-        except Exception as e:
-            print(f"❌ ข้อผิดพลาดเดือน {query_month}: {e}")
-            continue
+        print(f"📊 เดือน {query_month}: ดึงข้อมูลได้ {len(records)} รายการ")
+        return records
+    
+    except Exception as e:
+        print(f"❌ ข้อผิดพลาดเดือน {query_month}: {e}")
+        return None
+
+def fetch_mot_data_for_months(months: List[Tuple[int, int]]) -> Optional[List[Dict[str, Any]]]:
+    """ดึงข้อมูล MOT API สำหรับคู่ (ปี, เดือน) ที่ระบุ (ดึงทุกเดือนพร้อมกัน แม้จะต่างปี)"""
+    url = "https://datagov.mot.go.th/api/action/datastore_search"
+    all_records = []
+    
+    if not months:
+        return None
+    
+    query_months = [f"{year}-{month:02d}" for year, month in months]
+    with ThreadPoolExecutor(max_workers=len(query_months)) as executor:
+        # executor.map คืนผลตามลำดับเดือนที่ส่งไป
+        for records in executor.map(lambda query_month: _fetch_mot_month(url, query_month), query_months):
+            if records:
+                all_records.extend(records)
     
     return all_records if all_records else None
 
+def _parse_record_date(value: Any) -> Optional[date]:
+    """แปลงค่าวันที่หนึ่งค่าเป็น date (คืน None ถ้าแปลงไม่ได้)"""
+    try:
+        parsed = pd.to_datetime(value)
+        return None if pd.isna(parsed) else parsed.date()
+    except Exception:
+        return None
+
 def filter_new_records(records: List[Dict[str, Any]], since_date: date) -> List[Dict[str, Any]]:
-    """กรองเฉพาะข้อมูลใหม่"""
-    new_records = []
-    for record in records:
-        if 'วันที่' in record and record['วันที่']:
-            try:
-                record_date = pd.to_datetime(record['วันที่']).date()
-                if record_date > since_date:
-                    new_records.append(record)
-            except:
-                continue
+    """กรองเฉพาะข้อมูลใหม่ (แปลงวันที่ทั้งชุดครั้งเดียว)"""
+    df = pd.DataFrame(records)
+    if 'วันที่' not in df.columns:
+        new_records = []
+    else:
+        try:
+            # เปรียบเทียบเป็นวันที่ตามปฏิทิน (ใช้ได้ทั้งค่าที่มีและไม่มี timezone)
+            record_dates = pd.to_datetime(df['วันที่'], format='mixed', errors='coerce').dt.date
+        except (ValueError, TypeError):
+            # เช่น timezone ปนกันในชุดเดียว - แปลงทีละค่าแทน ค่าที่แปลงไม่ได้จะถูกข้าม
+            record_dates = df['วันที่'].map(_parse_record_date)
+        valid = record_dates.notna()
+        mask = valid & (record_dates.where(valid, since_date) > since_date)
+        new_records = df.loc[mask].to_dict('records')
     
     print(f"🆕 พบข้อมูลใหม่: {len(new_records)} รายการ")
     return new_records
@@ -116,13 +210,12 @@ def process_mot_data(records: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
     df['ปริมาณ'] = pd.to_numeric(df['ปริมาณ'], errors='coerce').fillna(0)
     
     # สร้าง pivot table
-    pivot_df = df.pivot_table(
-        index='วันที่',
-        columns='ยานพาหนะ/ท่า',
-        values='ปริมาณ',
-        aggfunc='sum',
-        fill_value=0
-    ).reset_index()
+    pivot_df = (
+        df.groupby(['วันที่', 'ยานพาหนะ/ท่า'])['ปริมาณ']
+        .sum()
+        .unstack(fill_value=0)
+        .reset_index()
+    )
     
     # แสดงคอลัมน์ที่ได้จาก pivot
     pivot_columns = [col for col in pivot_df.columns if col != 'วันที่']
@@ -130,34 +223,31 @@ def process_mot_data(records: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
     
     # Merge คอลัมน์ที่มีชื่อคล้ายกัน (ป้องกันการเขียนไม่สม่ำเสมอ)
     
-    # กลุ่มคำสำคัญสำหรับแต่ละสาย
-    line_groups = {
-        'ARL': ['arl', 'ARL', 'สุวรรณภูมิ'],
-        'BTS': ['bts', 'BTS', 'ลูกฟูก'],
-        'น้ำเงิน': ['น้ำเงิน', 'นำเงิน', 'น้าเงิน', 'สีน้ำเงิน'],
-        'ม่วง': ['ม่วง', 'มวง', 'สีม่วง'],
-        'ชมพู': ['ชมพู', 'ชมพูู', 'ชมพุ', 'สีชมพู'],
-        'แดง': ['แดง', 'แดง', 'สีแดง', 'ชานเมือง'],
-        'เหลือง': ['เหลือง', 'เหลืง', 'สีเหลือง']
-    }
-    
-    for line_key, keywords in line_groups.items():
-        # หาคอลัมน์ที่ตรงกับกลุ่มนี้
-        matching_cols = []
-        for col in pivot_columns:
-            if any(keyword in col for keyword in keywords):
-                matching_cols.append(col)
-        
+    # จับคู่คอลัมน์กับสายด้วย regex ที่ compile ไว้แล้ว (สายแรกที่ตรงชนะ)
+    cols_series = pd.Series(pivot_columns, dtype=object)
+    unassigned = pd.Series(True, index=cols_series.index)
+    line_to_cols = {}
+    for line_key, pattern in LINE_PATTERNS.items():
+        mask = unassigned & cols_series.str.contains(pattern, na=False)
+        if mask.any():
+            line_to_cols[line_key] = cols_series[mask].tolist()
+            unassigned &= ~mask
+    
+    # รวมค่าทั้งหมดเข้าคอลัมน์แรกของแต่ละสาย
+    col_to_main = {}
+    for line_key in LINE_GROUPS:
+        matching_cols = line_to_cols.get(line_key, [])
         if len(matching_cols) > 1:
             print(f"🔄 พบคอลัมน์ {line_key} หลายตัว: {matching_cols}")
-            # รวมค่าทั้งหมดเข้าคอลัมน์แรก
-            main_col = matching_cols[0]
-            for other_col in matching_cols[1:]:
-                pivot_df[main_col] = pivot_df[main_col] + pivot_df[other_col]
-                pivot_df = pivot_df.drop(columns=[other_col])
-            print(f"✅ รวม {line_key} เป็น: {main_col}")
+            print(f"✅ รวม {line_key} เป็น: {matching_cols[0]}")
         elif len(matching_cols) == 1:
             print(f"✅ {line_key}: {matching_cols[0]}")
+        for col in matching_cols:
+            col_to_main[col] = matching_cols[0]
+    
+    if any(col != main_col for col, main_col in col_to_main.items()):
+        merged = pivot_df[pivot_columns].rename(columns=col_to_main).T.groupby(level=0, sort=False).sum().T
+        pivot_df = pd.concat([pivot_df[['วันที่']], merged], axis=1)
     
     # อัปเดตรายการคอลัมน์หลังจาก merge
     pivot_columns = [col for col in pivot_df.columns if col != 'วันที่']
@@ -175,38 +265,36 @@ def process_mot_data(records: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
     }
     
     # เตรียมข้อมูลสำหรับฐานข้อมูล
-    result_data = []
     pivot_columns = [col for col in pivot_df.columns if col != 'วันที่']
     
-    for _, row in pivot_df.iterrows():
-        record_date = row['วันที่'].date()
-        dow = record_date.weekday()  # 0=Monday, 6=Sunday
-        
-        # สร้าง record
-        record = {
-            'feature_date': record_date,
-            'day_type': -1,  # ตั้งค่าเป็น -1 ตามที่ร้องขอ
-            'dow': dow,
-            'rain_average': None,  # ตั้งค่าเป็น null ตามที่ร้องขอ
-            'arl': 0.0,
-            'bts': 0.0,
-            'mrt_blue': 0.0,
-            'mrt_purple': 0.0,
-            'srt_red': 0.0,
-            'mrt_yellow': 0.0,
-            'mrt_pink': 0.0
+    # หาคอลัมน์ pivot ของแต่ละสาย (ถ้าตรงหลายคอลัมน์ ใช้คอลัมน์หลังสุด)
+    source_columns = {}
+    for pivot_col in pivot_columns:
+        for vehicle_name, target_col in vehicle_mapping.items():
+            if vehicle_name in pivot_col:
+                source_columns[target_col] = pivot_col
+                break
+    
+    # สร้าง DataFrame ทีละคอลัมน์แทนการวนทีละแถว
+    record_dates = pivot_df['วันที่']
+    result_df = pd.DataFrame({
+        'feature_date': record_dates.dt.date,
+        'day_type': -1,  # ตั้งค่าเป็น -1 ตามที่ร้องขอ
+        'dow': record_dates.dt.weekday,  # 0=Monday, 6=Sunday
+        'rain_average': None,  # ตั้งค่าเป็น null ตามที่ร้องขอ
+        **{
+            target_col: (
+                pivot_df[source_columns[target_col]].astype(float)
+                if target_col in source_columns else 0.0
+            )
+            for target_col in ['arl', 'bts', 'mrt_blue', 'mrt_purple', 'srt_red', 'mrt_yellow', 'mrt_pink']
         }
-        
-        # เติมข้อมูลยานพาหนะจาก pivot table
-        for pivot_col in pivot_columns:
-            for vehicle_name, target_col in vehicle_mapping.items():
-                if vehicle_name in pivot_col:
-                    record[target_col] = float(row.get(pivot_col, 0))
-                    break
-        
-        result_data.append(record)
+    })
     
-    result_df = pd.DataFrame(result_data)
+    # ลดขนาด dtype (จำนวนผู้โดยสารเป็นจำนวนเต็ม) ให้ frame และ payload ของ COPY เล็กลง
+    count_cols = ['arl', 'bts', 'mrt_blue', 'mrt_purple', 'srt_red', 'mrt_yellow', 'mrt_pink']
+    result_df[count_cols] = result_df[count_cols].round().astype('Int32')
+    result_df[['day_type', 'dow']] = result_df[['day_type', 'dow']].astype('Int8')
     
     # เรียงลำดับตามวันที่ก่อน return
     result_df = result_df.sort_values('feature_date').reset_index(drop=True)
@@ -234,64 +322,60 @@ def process_mot_data(records: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
 def insert_new_data(df: pd.DataFrame) -> bool:
     """บันทึกข้อมูลใหม่เข้าฐานข้อมูล พร้อมเรียงลำดับวันที่ถูกต้อง"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        # เรียงลำดับข้อมูลตามวันที่ก่อนบันทึก (เก่าสุดก่อน)
-        df = df.sort_values('feature_date').reset_index(drop=True)
-        
-        # เรียงลำดับ columns ให้ตรงกับตาราง
-        cols = [
-            "feature_date", "day_type", "dow", "rain_average",
-            "arl", "bts", "mrt_blue", "mrt_purple",
-            "srt_red", "mrt_yellow", "mrt_pink"
-        ]
-        df = df[cols]
-        
-        # แสดงข้อมูลที่จะบันทึก
-        print(f"💾 กำลังบันทึกข้อมูล {len(df)} รายการ (เรียงตามวันที่)...")
-        print(f"📅 ช่วงวันที่: {df['feature_date'].iloc[0]} ถึง {df['feature_date'].iloc[-1]}")
-        
-        if len(df) <= 7:
-            for idx, row in df.iterrows():
-                transport_info = []
-                if row['arl'] > 0: transport_info.append(f"ARL={row['arl']:.0f}")
-                if row['bts'] > 0: transport_info.append(f"BTS={row['bts']:.0f}")
-                transport_str = ", ".join(transport_info) if transport_info else "ไม่มีข้อมูล"
-                print(f"  {row['feature_date']}: {transport_str}")
-        else:
-            print(f"  ตัวอย่างแรก: {df.iloc[0]['feature_date']}")
-            print(f"  ตัวอย่างสุดท้าย: {df.iloc[-1]['feature_date']}")
-        
-        # ใช้ bulk UPSERT เพื่อประสิทธิภาพที่ดีกว่า
-        upsert_sql = """
-        INSERT INTO features (feature_date, day_type, dow, rain_average, arl, bts, mrt_blue, mrt_purple, srt_red, mrt_yellow, mrt_pink)
-        VALUES %s
-        ON CONFLICT (feature_date) 
-        DO UPDATE SET 
-            day_type = EXCLUDED.day_type,
-            dow = EXCLUDED.dow,
-            rain_average = EXCLUDED.rain_average,
-            arl = EXCLUDED.arl,
-            bts = EXCLUDED.bts,
-            mrt_blue = EXCLUDED.mrt_blue,
-            mrt_purple = EXCLUDED.mrt_purple,
-            srt_red = EXCLUDED.srt_red,
-            mrt_yellow = EXCLUDED.mrt_yellow,
-            mrt_pink = EXCLUDED.mrt_pink
-        """
-        
-        # เตรียมข้อมูลสำหรับ bulk insert
-        from psycopg2.extras import execute_values
-        values = [tuple(row) for row in df.values]
-        
-        # Execute bulk insert
-        execute_values(cur, upsert_sql, values, template=None, page_size=100)
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+        with _conn() as conn, conn.cursor() as cur:
+            # process_mot_data เรียงตามวันที่มาแล้ว ตรวจสอบแค่ลำดับ (O(N)) ไม่ต้อง sort ซ้ำ
+            assert df['feature_date'].is_monotonic_increasing, "caller must sort by feature_date"
+            
+            # เรียงลำดับ columns ให้ตรงกับตาราง
+            cols = [
+                "feature_date", "day_type", "dow", "rain_average",
+                "arl", "bts", "mrt_blue", "mrt_purple",
+                "srt_red", "mrt_yellow", "mrt_pink"
+            ]
+            df = df[cols]
+            
+            # แสดงข้อมูลที่จะบันทึก
+            print(f"💾 กำลังบันทึกข้อมูล {len(df)} รายการ (เรียงตามวันที่)...")
+            print(f"📅 ช่วงวันที่: {df['feature_date'].iloc[0]} ถึง {df['feature_date'].iloc[-1]}")
+            
+            if len(df) <= 7:
+                for idx, row in df.iterrows():
+                    transport_info = []
+                    if row['arl'] > 0: transport_info.append(f"ARL={row['arl']:.0f}")
+                    if row['bts'] > 0: transport_info.append(f"BTS={row['bts']:.0f}")
+                    transport_str = ", ".join(transport_info) if transport_info else "ไม่มีข้อมูล"
+                    print(f"  {row['feature_date']}: {transport_str}")
+            else:
+                print(f"  ตัวอย่างแรก: {df.iloc[0]['feature_date']}")
+                print(f"  ตัวอย่างสุดท้าย: {df.iloc[-1]['feature_date']}")
+            
+            # โหลดข้อมูลเข้า temp table ด้วย COPY แล้ว UPSERT ด้วย INSERT ... SELECT เดียว
+            cur.execute("CREATE TEMP TABLE features_stage (LIKE features INCLUDING DEFAULTS) ON COMMIT DROP")
+            
+            buf = io.StringIO()
+            df.to_csv(buf, index=False, header=False)
+            buf.seek(0)
+            cur.copy_expert(f"COPY features_stage ({', '.join(cols)}) FROM STDIN WITH CSV", buf)
+            
+            cur.execute(f"""
+            INSERT INTO features ({', '.join(cols)})
+            SELECT {', '.join(cols)} FROM features_stage
+            ON CONFLICT (feature_date) 
+            DO UPDATE SET 
+                day_type = EXCLUDED.day_type,
+                dow = EXCLUDED.dow,
+                rain_average = EXCLUDED.rain_average,
+                arl = EXCLUDED.arl,
+                bts = EXCLUDED.bts,
+                mrt_blue = EXCLUDED.mrt_blue,
+                mrt_purple = EXCLUDED.mrt_purple,
+                srt_red = EXCLUDED.srt_red,
+                mrt_yellow = EXCLUDED.mrt_yellow,
+                mrt_pink = EXCLUDED.mrt_pink
+            """)
+            
+            conn.commit()
+            
         print(f"✅ บันทึกข้อมูลสำเร็จ: {len(df)} รายการ (เรียงตามวันที่)")
         return True
         
@@ -354,13 +438,9 @@ def main():
     
     print(f"🗓️  แผนการค้นหา: {dict(query_plan)}")
     
-    # 3. ดึงข้อมูลจาก API ตาม query plan
-    all_records = []
-    for year, months in query_plan.items():
-        print(f"\n🔍 กำลังดึงข้อมูลปี {year}")
-        year_records = fetch_mot_data_for_months(year, months)
-        if year_records:
-            all_records.extend(year_records)
+    # 3. ดึงข้อมูลจาก API ทุกเดือนใน query plan พร้อมกัน (รวมกรณีข้ามปี เช่น ธ.ค. -> ม.ค.)
+    print(f"\n🔍 กำลังดึงข้อมูล {len(months_to_query)} เดือน")
+    all_records = fetch_mot_data_for_months(months_to_query)
     
     if not all_records:
         print("❌ ไม่สามารถดึงข้อมูลจาก API ได้")
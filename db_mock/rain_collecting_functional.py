@@ -1,135 +1,182 @@
-import openmeteo_requests
-
+import os
+import sys
+import time
+import numpy as np
 import pandas as pd
 import requests_cache
+from requests.adapters import HTTPAdapter
 from retry_requests import retry
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson is much faster than the stdlib json but is not installed everywhere
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    import json
+    json_loads = json.loads
 
-# Setup the Open-Meteo API client with cache and retry on error
+# Setup the HTTP session with cache and retry on error (plain JSON API, no protobuf client)
 cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
 retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-openmeteo = openmeteo_requests.Client(session = retry_session)
 
-# Bangkok BTS/MRT/ARL stations and major transport hubs
-bangkok_locations = [
+# Keep-alive pool big enough for the concurrent fallback fetches (keep the retry policy)
+fetch_workers = 16
+retry_session.mount("https://", HTTPAdapter(
+    pool_connections = 1,
+    pool_maxsize = fetch_workers,
+    max_retries = retry_session.get_adapter("https://").max_retries
+))
+
+# Bangkok BTS/MRT/ARL stations and major transport hubs (structured array: name/lat/lon columns)
+bangkok_locations = np.array([
     # BTS Silom Line
-    {"name": "BTS Siam", "lat": 13.7459, "lon": 100.5340},
-    {"name": "BTS Chong Nonsi", "lat": 13.7236, "lon": 100.5310},
-    {"name": "BTS Surasak", "lat": 13.7197, "lon": 100.5156},
-    {"name": "BTS Saphan Taksin", "lat": 13.7197, "lon": 100.5089},
-    {"name": "BTS Krung Thon Buri", "lat": 13.7211, "lon": 100.4944},
-    {"name": "BTS Wongwian Yai", "lat": 13.7244, "lon": 100.4756},
-    {"name": "BTS Bang Wa", "lat": 13.7250, "lon": 100.4033},
+    ("BTS Siam", 13.7459, 100.5340),
+    ("BTS Chong Nonsi", 13.7236, 100.5310),
+    ("BTS Surasak", 13.7197, 100.5156),
+    ("BTS Saphan Taksin", 13.7197, 100.5089),
+    ("BTS Krung Thon Buri", 13.7211, 100.4944),
+    ("BTS Wongwian Yai", 13.7244, 100.4756),
+    ("BTS Bang Wa", 13.7250, 100.4033),
     
     # BTS Sukhumvit Line
-    {"name": "BTS Phrom Phong", "lat": 13.7308, "lon": 100.5697},
-    {"name": "BTS Thong Lo", "lat": 13.7244, "lon": 100.5797},
-    {"name": "BTS Ekkamai", "lat": 13.7197, "lon": 100.5889},
-    {"name": "BTS Phra Khanong", "lat": 13.7178, "lon": 100.5950},
-    {"name": "BTS On Nut", "lat": 13.7056, "lon": 100.6014},
-    {"name": "BTS Bang Chak", "lat": 13.6936, "lon": 100.6078},
-    {"name": "BTS Bearing", "lat": 13.6631, "lon": 100.6069},
-    {"name": "BTS Samrong", "lat": 13.6464, "lon": 100.6081},
-    {"name": "BTS Mo Chit", "lat": 13.8028, "lon": 100.5544},
-    {"name": "BTS Saphan Phut", "lat": 13.8139, "lon": 100.5556},
-    {"name": "BTS Lat Phrao", "lat": 13.8167, "lon": 100.6108},
+    ("BTS Phrom Phong", 13.7308, 100.5697),
+    ("BTS Thong Lo", 13.7244, 100.5797),
+    ("BTS Ekkamai", 13.7197, 100.5889),
+    ("BTS Phra Khanong", 13.7178, 100.5950),
+    ("BTS On Nut", 13.7056, 100.6014),
+    ("BTS Bang Chak", 13.6936, 100.6078),
+    ("BTS Bearing", 13.6631, 100.6069),
+    ("BTS Samrong", 13.6464, 100.6081),
+    ("BTS Mo Chit", 13.8028, 100.5544),
+    ("BTS Saphan Phut", 13.8139, 100.5556),
+    ("BTS Lat Phrao", 13.8167, 100.6108),
     
     # MRT Blue Line
-    {"name": "MRT Hua Lamphong", "lat": 13.7375, "lon": 100.5169},
-    {"name": "MRT Khlong Toei", "lat": 13.7208, "lon": 100.5442},
-    {"name": "MRT Queen Sirikit", "lat": 13.7286, "lon": 100.5561},
-    {"name": "MRT Sukhumvit", "lat": 13.7381, "lon": 100.5603},
-    {"name": "MRT Phetchaburi", "lat": 13.7486, "lon": 100.5644},
-    {"name": "MRT Phra Ram 9", "lat": 13.7597, "lon": 100.5661},
-    {"name": "MRT Sutthisan", "lat": 13.7800, "lon": 100.5717},
-    {"name": "MRT Huai Khwang", "lat": 13.7675, "lon": 100.5744},
-    {"name": "MRT Thailand Cultural Centre", "lat": 13.7692, "lon": 100.5481},
-    {"name": "MRT Chatuchak Park", "lat": 13.7981, "lon": 100.5522},
-    {"name": "MRT Bang Sue", "lat": 13.8200, "lon": 100.5344},
-    {"name": "MRT Tao Poon", "lat": 13.8064, "lon": 100.5206},
-    {"name": "MRT Bang Pho", "lat": 13.7892, "lon": 100.5139},
-    {"name": "MRT Lat Mayom", "lat": 13.7636, "lon": 100.4839},
+    ("MRT Hua Lamphong", 13.7375, 100.5169),
+    ("MRT Khlong Toei", 13.7208, 100.5442),
+    ("MRT Queen Sirikit", 13.7286, 100.5561),
+    ("MRT Sukhumvit", 13.7381, 100.5603),
+    ("MRT Phetchaburi", 13.7486, 100.5644),
+    ("MRT Phra Ram 9", 13.7597, 100.5661),
+    ("MRT Sutthisan", 13.7800, 100.5717),
+    ("MRT Huai Khwang", 13.7675, 100.5744),
+    ("MRT Thailand Cultural Centre", 13.7692, 100.5481),
+    ("MRT Chatuchak Park", 13.7981, 100.5522),
+    ("MRT Bang Sue", 13.8200, 100.5344),
+    ("MRT Tao Poon", 13.8064, 100.5206),
+    ("MRT Bang Pho", 13.7892, 100.5139),
+    ("MRT Lat Mayom", 13.7636, 100.4839),
     
     # MRT Purple Line
-    {"name": "MRT Khlong Bang Phai", "lat": 13.8333, "lon": 100.5206},
-    {"name": "MRT Talad Bang Yai", "lat": 13.8519, "lon": 100.5367},
-    {"name": "MRT Sam Yaek Bang Yai", "lat": 13.8656, "lon": 100.5447},
-    {"name": "MRT Bang Phlu", "lat": 13.8797, "lon": 100.5542},
-    {"name": "MRT Bang Rak Yai", "lat": 13.8953, "lon": 100.5636},
-    {"name": "MRT Tha It", "lat": 13.9097, "lon": 100.5722},
+    ("MRT Khlong Bang Phai", 13.8333, 100.5206),
+    ("MRT Talad Bang Yai", 13.8519, 100.5367),
+    ("MRT Sam Yaek Bang Yai", 13.8656, 100.5447),
+    ("MRT Bang Phlu", 13.8797, 100.5542),
+    ("MRT Bang Rak Yai", 13.8953, 100.5636),
+    ("MRT Tha It", 13.9097, 100.5722),
     
     # Airport Rail Link (ARL)
-    {"name": "ARL Phaya Thai", "lat": 13.7775, "lon": 100.5344},
-    {"name": "ARL Ratchaprarop", "lat": 13.7519, "lon": 100.5414},
-    {"name": "ARL Makkasan", "lat": 13.7450, "lon": 100.5631},
-    {"name": "ARL Ramkhamhaeng", "lat": 13.7639, "lon": 100.6181},
-    {"name": "ARL Hua Mak", "lat": 13.7519, "lon": 100.6456},
-    {"name": "ARL Ban Thap Chang", "lat": 13.7297, "lon": 100.6756},
-    {"name": "ARL Lat Krabang", "lat": 13.7308, "lon": 100.7542},
-    {"name": "ARL Suvarnabhumi", "lat": 13.6900, "lon": 100.7500},
+    ("ARL Phaya Thai", 13.7775, 100.5344),
+    ("ARL Ratchaprarop", 13.7519, 100.5414),
+    ("ARL Makkasan", 13.7450, 100.5631),
+    ("ARL Ramkhamhaeng", 13.7639, 100.6181),
+    ("ARL Hua Mak", 13.7519, 100.6456),
+    ("ARL Ban Thap Chang", 13.7297, 100.6756),
+    ("ARL Lat Krabang", 13.7308, 100.7542),
+    ("ARL Suvarnabhumi", 13.6900, 100.7500),
     
     # Major Transport Hubs
-    {"name": "Victory Monument", "lat": 13.7650, "lon": 100.5375},
-    {"name": "Chatuchak Weekend Market", "lat": 13.7981, "lon": 100.5522},
-    {"name": "Central World", "lat": 13.7467, "lon": 100.5400},
-    {"name": "MBK Center", "lat": 13.7444, "lon": 100.5306},
-    {"name": "Terminal 21", "lat": 13.7381, "lon": 100.5603},
-    {"name": "EmQuartier", "lat": 13.7308, "lon": 100.5697},
-    {"name": "ICONSIAM", "lat": 13.7267, "lon": 100.5089},
-    {"name": "Central Ladprao", "lat": 13.8167, "lon": 100.6108},
-]
+    ("Victory Monument", 13.7650, 100.5375),
+    ("Chatuchak Weekend Market", 13.7981, 100.5522),
+    ("Central World", 13.7467, 100.5400),
+    ("MBK Center", 13.7444, 100.5306),
+    ("Terminal 21", 13.7381, 100.5603),
+    ("EmQuartier", 13.7308, 100.5697),
+    ("ICONSIAM", 13.7267, 100.5089),
+    ("Central Ladprao", 13.8167, 100.6108),
+], dtype=[('name', 'U40'), ('lat', 'f8'), ('lon', 'f8')])
 
 url = "https://api.open-meteo.com/v1/forecast"
+summary_csv = "rain_data_bangkok_summary.csv"
 
-all_data = []
+# Skip the network entirely if the summary was regenerated within the cache window
+if os.path.exists(summary_csv) and time.time() - os.path.getmtime(summary_csv) < 3600:
+    print(f"Cache hit: {summary_csv} is less than 1 hour old, skipping fetch")
+    sys.exit(0)
 
-# Loop through each location
-for location in bangkok_locations:
-    print(f"\nCollecting data for {location['name']}...")
-    
-    params = {
-        "latitude": location["lat"],
-        "longitude": location["lon"],
-        "daily": "rain_sum",
-        "timezone": "Asia/Bangkok",
-        "start_date": "2025-09-04",
-        "end_date": "2025-09-30",
-    }
-    
-    responses = openmeteo.weather_api(url, params=params)
-    response = responses[0]
-    
-    print(f"Coordinates: {response.Latitude()}°N {response.Longitude()}°E")
-    print(f"Elevation: {response.Elevation()} m asl")
-    
-    # Process daily data
-    daily = response.Daily()
-    daily_rain_sum = daily.Variables(0).ValuesAsNumpy()
-    
-    daily_data = {
-        "date": pd.date_range(
-            start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-            end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-            freq = pd.Timedelta(seconds = daily.Interval()),
-            inclusive = "left"
-        ),
-        "location": location["name"],
-        "latitude": location["lat"],
-        "longitude": location["lon"],
-        "rain_sum": daily_rain_sum
-    }
+# Fetch all locations in a single request (Open-Meteo accepts comma-separated coordinates)
+print(f"\nCollecting data for {len(bangkok_locations)} locations in one request...")
+
+params = {
+    "latitude": ",".join(map(str, bangkok_locations["lat"])),
+    "longitude": ",".join(map(str, bangkok_locations["lon"])),
+    "daily": "rain_sum",
+    "timezone": "Asia/Bangkok",
+    "start_date": "2025-09-04",
+    "end_date": "2025-09-30",
+}
+
+def fetch_json(request_params):
+    """Fetch the JSON forecast; always returns a list (one entry per coordinate)"""
+    response = retry_session.get(url, params=request_params, timeout=30)
+    response.raise_for_status()
+    data = json_loads(response.content)
+    return data if isinstance(data, list) else [data]
+
+def fetch_location(location):
+    """Fetch a single location (used only if the batched request fails)"""
+    location_params = dict(params, latitude=str(location["lat"]), longitude=str(location["lon"]))
+    return fetch_json(location_params)[0]
+
+try:
+    responses = fetch_json(params)
+except Exception as e:
+    # Fall back to per-location requests, one pooled connection per worker thread
+    print(f"Batched request failed ({e}), fetching locations concurrently...")
+    with ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+        responses = list(executor.map(fetch_location, bangkok_locations))
+
+# Every location shares the same daily axis (local dates in Asia/Bangkok)
+dates = pd.DatetimeIndex(np.asarray(responses[0]["daily"]["time"], dtype="datetime64[D]"))
+
+# Fill a float32 [n_locations, n_days] matrix (rain is reported to 0.1 mm, float32 is plenty)
+n_locations, n_days = len(bangkok_locations), len(dates)
+rain_arrays = np.empty((n_locations, n_days), dtype=np.float32)
+
+# Responses come back in the same order as the coordinates we sent
+log_lines = []
+for i, (location, response) in enumerate(zip(bangkok_locations, responses)):
+    log_lines.append(f"\n{location['name']}: {response['latitude']}°N {response['longitude']}°E")
+    log_lines.append(f"Elevation: {response['elevation']} m asl")
     
-    location_df = pd.DataFrame(data = daily_data)
-    all_data.append(location_df)
+    # Process daily data (null values become NaN)
+    rain_arrays[i] = np.asarray(response["daily"]["rain_sum"], dtype=np.float32)
+
+# Emit the per-location info in one write instead of two prints per location
+sys.stdout.write("\n".join(log_lines) + "\n")
 
-# Combine all data
-combined_dataframe = pd.concat(all_data, ignore_index=True)
+# Build the combined frame in one shot from the matrix
+combined_dataframe = pd.DataFrame({
+    "date": np.tile(dates, n_locations),
+    "location": np.repeat(bangkok_locations["name"], n_days),
+    "latitude": np.repeat(bangkok_locations["lat"], n_days),
+    "longitude": np.repeat(bangkok_locations["lon"], n_days),
+    "rain_sum": rain_arrays.ravel()
+})
 
 print(f"\nCombined data from {len(bangkok_locations)} Bangkok locations")
 print(combined_dataframe)
 
 # Also create a summary by date (average across all locations)
-summary_df = combined_dataframe.groupby('date')['rain_sum'].agg(['mean', 'min', 'max', 'std']).reset_index()
-summary_df.columns = ['date', 'avg_rain_sum', 'min_rain_sum', 'max_rain_sum', 'std_rain_sum']
+# Reduce the matrix along the location axis; nan* versions skip missing values like groupby does
+summary_df = pd.DataFrame({
+    "date": dates,
+    "avg_rain_sum": np.nanmean(rain_arrays, axis=0),
+    "min_rain_sum": np.nanmin(rain_arrays, axis=0),
+    "max_rain_sum": np.nanmax(rain_arrays, axis=0),
+    "std_rain_sum": np.nanstd(rain_arrays, axis=0, ddof=1, dtype=np.float64).astype(np.float32)
+})
 
 
 # Find heaviest rain days
@@ -144,11 +191,25 @@ else:
 if not heavy_rain_days.empty:
     heaviest_day = summary_df.loc[summary_df['max_rain_sum'].idxmax()]
     print(f"\nHeaviest rain day: {heaviest_day['date']} with max {heaviest_day['max_rain_sum']:.1f}mm")
-    heaviest_day_data = combined_dataframe[combined_dataframe['date'] == heaviest_day['date']]
-    heaviest_locations = heaviest_day_data.nlargest(5, 'rain_sum')[['location', 'rain_sum']]
+    # Top-5 selection on that day's column of the matrix (argpartition, no full sort)
+    col = rain_arrays[:, summary_df['max_rain_sum'].idxmax()]
+    valid = np.flatnonzero(~np.isnan(col))  # stations without data are left out of the ranking
+    top_k = min(5, valid.size)
+    idx = valid[np.argpartition(col[valid], -top_k)[-top_k:]]
+    idx = idx[np.argsort(-col[idx])]
+    heaviest_locations = pd.DataFrame({
+        "location": bangkok_locations["name"][idx],
+        "rain_sum": col[idx]
+    })
     print("Top 5 districts with most rain on that day:")
     print(heaviest_locations)
 
 print(f"\nDaily summary across Bangkok:")
 # print(summary_df)
-summary_df.to_csv("rain_data_bangkok_summary.csv", index=False)
\ No newline at end of file
+# Format all rows with one fixed format string instead of pandas' per-cell CSV path
+summary_rows = np.rec.fromarrays(
+    [dates.strftime("%Y-%m-%d").to_numpy()] + [summary_df[col].to_numpy() for col in summary_df.columns[1:]]
+)
+with open(summary_csv, "w", buffering=1 << 20, newline="") as f:
+    np.savetxt(f, summary_rows, fmt="%s,%.4f,%.4f,%.4f,%.4f",
+               header=",".join(summary_df.columns), comments="", newline="\n")
\ No newline at end of file
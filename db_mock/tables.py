@@ -1,5 +1,9 @@
-import psycopg2
-from psycopg2 import sql
+import atexit
+import re
+import threading
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
 
 # --- PostgreSQL connection config ---
 DB_CONFIG = {
@@ -10,6 +14,27 @@ DB_CONFIG = {
     "password": "airflow"
 }
 
+# --- Connection pool (created on first use, reused across calls) ---
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadedConnectionPool(minconn=1, maxconn=4, **DB_CONFIG)
+            atexit.register(_POOL.closeall)
+    return _POOL
+
+@contextmanager
+def _conn():
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 # --- SQL statements to create tables ---
 CREATE_TABLES_SQL = [
     # 1. Train Features
@@ -28,6 +53,7 @@ CREATE_TABLES_SQL = [
         mrt_pink FLOAT
     );
     CREATE INDEX IF NOT EXISTS idx_features_date ON features(feature_date);
+    CREATE INDEX IF NOT EXISTS idx_features_null_rain ON features(feature_date) WHERE rain_average IS NULL;
     """,
     
     # 2. Predictions
@@ -52,18 +78,38 @@ CREATE_TABLES_SQL = [
     
 ]
 
+# Tables/indexes each DDL block creates, used to skip blocks that are already fully in place
+_RELATIONS_PER_SQL = [
+    re.findall(r"(?:TABLE|INDEX) IF NOT EXISTS (\w+)", sql_stmt) for sql_stmt in CREATE_TABLES_SQL
+]
+
 def create_tables():
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.autocommit = True
-        cursor = conn.cursor()
-        
+        with _conn() as conn, conn.cursor() as cursor:
+            # Check which tables/indexes already exist in one catalog query
+            # (current_schema() is where the unqualified DDL below would create them)
+            cursor.execute(
+                """
+                SELECT c.relname FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = current_schema() AND c.relname = ANY(%s)
+                """,
+                ([name for names in _RELATIONS_PER_SQL for name in names],)
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            pending = [
+                sql_stmt for sql_stmt, names in zip(CREATE_TABLES_SQL, _RELATIONS_PER_SQL)
+                if not existing.issuperset(names)
+            ]
+            
+            # Send the missing DDL as one multi-statement query in a single transaction (one round-trip)
+            if pending:
+                cursor.execute("\n".join(pending))
+            conn.commit()
         for sql_stmt in CREATE_TABLES_SQL:
-            cursor.execute(sql_stmt)
-            print("Executed successfully:\n", sql_stmt.split("\n")[1].strip())
+            status = "Executed successfully" if sql_stmt in pending else "Already exists, skipped"
+            print(f"{status}:\n", sql_stmt.split("\n")[1].strip())
         
-        cursor.close()
-        conn.close()
         print("All tables created successfully.")
     except Exception as e:
         print("Error creating tables:", e)